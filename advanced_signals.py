@@ -6,9 +6,10 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator, SMAIndicator
+from ta.trend import EMAIndicator, SMAIndicator, MACD
 from ta.momentum import RSIIndicator
 from ta.volatility import AverageTrueRange
+from pivots import pivot_index, SwingPivotIndex
 
 class AdvancedSignalEngine:
     """موتور سیگنالدهی پیشرفته"""
@@ -176,51 +177,36 @@ class AdvancedSignalEngine:
     
     @staticmethod
     def find_divergences(df):
-        """یافتن واگراییها"""
+        """یافتن واگراییها بین نقاط چرخش متوالی"""
         if len(df) < 30:
             return []
         
-        df = df.copy()
-        df['rsi'] = RSIIndicator(df['close'], window=14).rsi()
+        rsi = RSIIndicator(df['close'], window=14).rsi()
+        macd = MACD(df['close']).macd_diff()
+        pivots = pivot_index.update(df, rsi, macd)
         
         divergences = []
-        lookback = 5
         
-        for i in range(lookback * 2, len(df)):
-            try:
-                # واگرایی صعودی
-                if (df['close'].iloc[i] < df['close'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] > df['rsi'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] < 40):
-                    
-                    divergences.append({
-                        'index': i,
-                        'type': 'BULLISH_DIVERGENCE',
-                        'signal': 'BUY',
-                        'strength': 85,
-                        'reason': f'📈 RSI Bullish Divergence (RSI: {df["rsi"].iloc[i]:.1f})',
-                        'price': df['close'].iloc[i],
-                        'rsi': df['rsi'].iloc[i],
-                        'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else None
-                    })
-                
-                # واگرایی نزولی
-                if (df['close'].iloc[i] > df['close'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] < df['rsi'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] > 60):
-                    
-                    divergences.append({
-                        'index': i,
-                        'type': 'BEARISH_DIVERGENCE',
-                        'signal': 'SELL',
-                        'strength': 85,
-                        'reason': f'📉 RSI Bearish Divergence (RSI: {df["rsi"].iloc[i]:.1f})',
-                        'price': df['close'].iloc[i],
-                        'rsi': df['rsi'].iloc[i],
-                        'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else None
-                    })
-            except:
-                continue
+        for kind, prev, last, macd_confirms in SwingPivotIndex.divergences(pivots):
+            i = last['index']
+            confirm = ' + MACD' if macd_confirms else ''
+            
+            if kind == 'BULLISH':
+                sig_type, direction, icon = 'BULLISH_DIVERGENCE', 'BUY', '📈'
+            else:
+                sig_type, direction, icon = 'BEARISH_DIVERGENCE', 'SELL', '📉'
+            
+            divergences.append({
+                'index': i,
+                'type': sig_type,
+                'signal': direction,
+                'strength': 90 if macd_confirms else 85,
+                'reason': f'{icon} RSI{confirm} {kind.title()} Divergence (RSI: {prev["rsi"]:.1f} → {last["rsi"]:.1f})',
+                'price': df['close'].iloc[i],
+                'pivot_price': last['price'],
+                'rsi': last['rsi'],
+                'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else None
+            })
         
         return divergences[-5:] if divergences else []
     
@@ -490,7 +476,12 @@ class UltimateSignalGenerator:
     def get_combined_score(self, df, symbol):
         """امتیاز ترکیبی"""
         signals = self.analyze(df, symbol)
-        
+        price = df['close'].iloc[-1] if len(df) > 0 else 0
+        return self.score_signals(signals, symbol, price)
+    
+    @staticmethod
+    def score_signals(signals, symbol, price=0):
+        """امتیاز ترکیبی از سیگنالهای آماده (بدون تحلیل مجدد)"""
         buy_score = 0
         sell_score = 0
         buy_reasons = []
@@ -530,7 +521,7 @@ class UltimateSignalGenerator:
                 'score': round(buy_score, 1),
                 'confidence': min(buy_score / 3, 95),
                 'reasons': buy_reasons[:5],
-                'price': df['close'].iloc[-1] if len(df) > 0 else 0
+                'price': price
             }
         elif sell_score > buy_score and sell_score > 80:
             return {
@@ -539,7 +530,7 @@ class UltimateSignalGenerator:
                 'score': round(sell_score, 1),
                 'confidence': min(sell_score / 3, 95),
                 'reasons': sell_reasons[:5],
-                'price': df['close'].iloc[-1] if len(df) > 0 else 0
+                'price': price
             }
         else:
             return {
@@ -0,0 +1,150 @@
+"""
+اجرای موازی تحلیل سیگنالها روی چند پردازه
+کندلها از طریق multiprocessing.shared_memory منتقل میشوند
+"""
+import os
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from metrics import registry
+from pivots import pivot_index
+
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+DETECTOR_SECONDS = registry.histogram('analysis_detector_seconds', 'Time spent in each signal detector', ['detector'])
+ANALYSIS_ERRORS = registry.counter('analysis_errors_total', 'Symbols whose analysis raised in a worker')
+
+
+def _frame_from_block(shm_name, total_rows, start, end, symbol):
+    """ساخت DataFrame از بخشی از حافظه مشترک"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray((total_rows, len(CANDLE_COLUMNS)), dtype=np.float64, buffer=shm.buf)
+        rows = block[start:end].copy()
+    finally:
+        shm.close()
+
+    df = pd.DataFrame(rows, columns=CANDLE_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'].astype(np.int64), unit='ms')
+    df['symbol'] = symbol
+    return df
+
+
+def _analyze_task(shm_name, total_rows, start, end, symbol, pivot_state=None):
+    """اجرا در پردازه کارگر"""
+    from signals import signal_generator
+
+    df = _frame_from_block(shm_name, total_rows, start, end, symbol)
+    # وضعیت نقاط چرخش از پردازه اصلی؛ مهم نیست کدام کارگر این ارز را بگیرد
+    pivot_index.set_state(symbol, pivot_state)
+    timings = {}
+    try:
+        signals = signal_generator.analyze(df, symbol, timings)
+    finally:
+        pivot_state = pivot_index.pop_state(symbol)
+    return symbol, signals, timings, pivot_state
+
+
+class AnalysisExecutor:
+    """توزیع analyze روی استخر پردازهها"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """راهاندازی استخر"""
+        with self.lock:
+            if self.pool is None and self.workers > 1:
+                # spawn: پردازه اصلی چند نخی است و fork امن نیست
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=mp.get_context('spawn')
+                )
+                print(f"⚙️ Analysis pool started ({self.workers} workers)")
+            return self.pool
+
+    def stop(self):
+        """توقف استخر"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    @staticmethod
+    def pack_frames(frames):
+        """کپی کندلهای همه ارزها در یک بلوک حافظه مشترک"""
+        total_rows = sum(len(df) for df in frames.values())
+        shm = shared_memory.SharedMemory(
+            create=True,
+            size=max(total_rows, 1) * len(CANDLE_COLUMNS) * 8
+        )
+        block = np.ndarray((total_rows, len(CANDLE_COLUMNS)), dtype=np.float64, buffer=shm.buf)
+
+        offsets = {}
+        pos = 0
+        for symbol, df in frames.items():
+            n = len(df)
+            block[pos:pos + n, 0] = df['timestamp'].values.astype('datetime64[ms]').astype(np.int64)
+            block[pos:pos + n, 1:] = df[CANDLE_COLUMNS[1:]].to_numpy(dtype=np.float64)
+            offsets[symbol] = (pos, pos + n)
+            pos += n
+
+        return shm, total_rows, offsets
+
+    def analyze_many(self, frames):
+        """تحلیل چند ارز؛ خروجی (symbol, signals) به ترتیب اتمام"""
+        frames = {s: df for s, df in frames.items() if not df.empty}
+        if not frames:
+            return
+
+        if self.start() is None:
+            from signals import signal_generator
+            for symbol, df in frames.items():
+                timings = {}
+                signals = signal_generator.analyze(df, symbol, timings)
+                self.record(timings)
+                yield symbol, signals
+            return
+
+        shm, total_rows, offsets = self.pack_frames(frames)
+        try:
+            futures = {
+                self.pool.submit(_analyze_task, shm.name, total_rows, start, end, symbol,
+                                 pivot_index.get_state(symbol)): symbol
+                for symbol, (start, end) in offsets.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    symbol, signals, timings, pivot_state = future.result()
+                except Exception as e:
+                    ANALYSIS_ERRORS.inc()
+                    print(f"❌ Analysis failed for {futures[future]}: {e}")
+                    continue
+                pivot_index.set_state(symbol, pivot_state)
+                self.record(timings)
+                yield symbol, signals
+        finally:
+            shm.close()
+            shm.unlink()
+
+    @staticmethod
+    def record(timings):
+        """ثبت زمان detector ها در متریکها"""
+        for name, seconds in timings.items():
+            DETECTOR_SECONDS.observe(seconds, detector=name)
+
+    def analyze(self, df, symbol):
+        """تحلیل یک ارز"""
+        for _, signals in self.analyze_many({symbol: df}):
+            return signals
+        return []
+
+
+# نمونه گلوبال
+analysis_executor = AnalysisExecutor(int(os.environ.get('ANALYSIS_WORKERS', 0)) or None)
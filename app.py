@@ -1,11 +1,12 @@
 """
 🚀 سرور اصلی Flask
 """
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_socketio import SocketIO, emit
 from datetime import datetime, timedelta
 import threading
 import time
+import os
 import json
 
 from database import signal_db
@@ -13,76 +14,93 @@ from data_fetcher import exchange_manager
 from signals import signal_generator
 from indicators import TechnicalIndicators
 from signal_validator import validator
+from analysis_pool import analysis_executor
+from leaderboard import leaderboard
+from prescreen import prescreen
+from order_blocks import zone_index
+from scanner import scanner
+from broadcast import broadcaster
+from metrics import registry, scrape, merge
+from snapshot import SocketJSON
+from checkpoint import StateCheckpoint
+from supervisor import follow_exchange
+from retention import retention
+from hot_tier import hot_tier
+from export import exporter
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'crypto_futures_secret_2024'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-# ذخیره داده ها
-cache = {
-    'signals': [],
-    'pump_dump': [],
-    'movers': {'gainers': [], 'losers': []},
-    'last_update': None
-}
-
-def scan_all_symbols():
-    """اسکن همه ارزها"""
-    global cache
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', json=SocketJSON)
+
+# نسخههای کش (توسط اسکنر منتشر میشود)
+snapshots = scanner.snapshots
+shard_state = {}
+shard_lock = threading.RLock()
+
+# شروع گرم اسکنر همین پردازه (حالت all)
+checkpoint = StateCheckpoint(scanner, os.environ.get('SCANNER_STATE', 'scanner_state.ckpt'))
+
+def shard_parts(event, origin, data, max_age=3600):
+    """آخرین داده هر اسکنر جدا (shard) برای یک رویداد"""
+    now = time.time()
+    with shard_lock:
+        state = shard_state.setdefault(event, {})
+        state[origin] = (now, data)
+        
+        # اسکنرهایی که مدتی خبری از آنها نیست
+        for key in [k for k, (t, _) in state.items() if now - t > max_age]:
+            del state[key]
+        return [d for _, d in state.values()]
+
+def merge_shard_cache(origin, data):
+    """ترکیب کش اسکنرهای جدا (shard ها) در کش این پردازه"""
+    if isinstance(data, str):
+        data = json.loads(data)
+    parts = shard_parts('cache_update', origin, data)
+    signals = sorted((s for d in parts for s in d.get('signals', [])), key=lambda s: s.get('detected_at', ''))
+    pump_dump = sorted((s for d in parts for s in d.get('pump_dump', [])), key=lambda s: s.get('detected_at', ''))
     
-    while True:
-        try:
-            all_signals = []
-            pump_dump_alerts = []
-            
-            symbols = exchange_manager.symbols[:100]  # 100 تا اول
-            
-            for i, symbol in enumerate(symbols):
-                try:
-                    df = exchange_manager.fetch_ohlcv(symbol, '15m', 200)
-                    if df.empty:
-                        continue
-                    
-                    # تولید سیگنال
-                    signals = signal_generator.get_best_signals(df, symbol, 3)
-                    
-                    for sig in signals:
-                        sig['detected_at'] = datetime.utcnow().isoformat()
-                        all_signals.append(sig)
-                        
-                        # ذخیره در دیتابیس
-                        signal_db.save_signal(sig)
-                        
-                        # پامپ و دامپ
-                        if 'PUMP' in sig.get('type', '') or 'DUMP' in sig.get('type', ''):
-                            pump_dump_alerts.append(sig)
-                            signal_db.save_pump_dump(sig)
-                    
-                    # ارسال به کلاینت
-                    if signals:
-                        socketio.emit('new_signals', signals)
-                    
-                    time.sleep(0.3)
-                    
-                except Exception as e:
-                    continue
-            
-            # بروزرسانی کش
-            cache['signals'] = all_signals[-100:]
-            cache['pump_dump'] = pump_dump_alerts[-50:]
-            cache['movers'] = exchange_manager.get_top_movers(20)
-            cache['last_update'] = datetime.utcnow().isoformat()
-            
-            # ارسال بروزرسانی
-            socketio.emit('cache_update', cache)
-            
-            print(f"✅ Scan complete: {len(all_signals)} signals found")
-            
-            time.sleep(60)  # هر 1 دقیقه
-            
-        except Exception as e:
-            print(f"Scan error: {e}")
-            time.sleep(30)
+    snapshot = snapshots.publish(
+        signals=signals[-100:],
+        pump_dump=pump_dump[-50:],
+        movers=data.get('movers', snapshots.current['movers']),
+        last_update=max(d.get('last_update') or '' for d in parts) or None
+    )
+    return snapshot.json['cache']
+
+def merge_shard_leaderboard(origin, data):
+    """جدول امتیاز کامل هر shard؛ جدول این پردازه از همه ساخته و N برتر ارسال میشود"""
+    with shard_lock:
+        parts = shard_parts('leaderboard_update', origin, data)
+        leaderboard.load(s for d in parts for s in d.get('buy', []) + d.get('sell', []))
+        return leaderboard.snapshot()
+
+def merge_shard_prescreen(origin, data):
+    """هشدارهای پیشغربالگری همه shard ها (هر ارز در بازه cooldown یکبار)"""
+    with shard_lock:
+        parts = shard_parts('prescreen_update', origin, data)
+        alerts, last = [], {}
+        for alert in sorted((a for d in parts for a in d), key=lambda a: a['detected_at']):
+            at = datetime.fromisoformat(alert['detected_at'])
+            seen = last.get(alert['symbol'])
+            if seen is not None and (at - seen).total_seconds() < prescreen.cooldown:
+                continue
+            last[alert['symbol']] = at
+            alerts.append(alert)
+        prescreen.load_flagged(alerts)
+    return None
+
+def merge_shard_pipeline(origin, data):
+    """وضعیت پایپلاین هر shard (فقط برای REST؛ به کلاینتها ارسال نمیشود)"""
+    shard_parts('pipeline_update', origin, [{**m, 'origin': origin} for m in data], max_age=60)
+    return None
+
+def pipeline_metrics():
+    """پایپلاین همین پردازه یا همه shard ها (حالت وب)"""
+    with shard_lock:
+        if 'pipeline_update' in shard_state:
+            return [m for _, d in shard_state['pipeline_update'].values() for m in d]
+    return scanner.pipeline_metrics()
 
 @app.route('/')
 def index():
@@ -94,31 +112,138 @@ def analytics():
 
 @app.route('/api/signals')
 def get_signals():
-    return jsonify(cache['signals'][-50:])
+    return serve_snapshot('signals')
 
 @app.route('/api/signals/history')
 def get_signal_history():
-    days = request.args.get('days', 7, type=int)
-    signals = signal_db.get_signal_history(days)
-    return jsonify(signals)
+    since = request.args.get('since')
+    if since is None:
+        since = datetime.utcnow() - timedelta(days=request.args.get('days', 7, type=int))
+    try:
+        page = hot_tier.query_signals(
+            symbol=request.args.get('symbol'),
+            signal_type=request.args.get('type'),
+            direction=request.args.get('direction'),
+            min_strength=request.args.get('min_strength', type=int),
+            since=since,
+            until=request.args.get('until'),
+            status=request.args.get('status'),
+            limit=min(request.args.get('limit', 500, type=int), 1000),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(page['signals'])
+    # صفحه بعد: ?cursor=<X-Next-Cursor>
+    if page['next_cursor']:
+        response.headers['X-Next-Cursor'] = page['next_cursor']
+    return response
 
 @app.route('/api/pump-dump')
 def get_pump_dump():
-    return jsonify(cache['pump_dump'])
+    return serve_snapshot('pump_dump')
+
+@app.route('/api/archive/<table>')
+def get_archive(table):
+    if table not in ('signals', 'pump_dump_alerts'):
+        return jsonify({'error': 'unknown table'}), 404
+    rows = retention.query_archive(
+        table,
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+        limit=min(request.args.get('limit', 500, type=int), 5000),
+        symbol=request.args.get('symbol')
+    )
+    return jsonify(rows)
+
+@app.route('/api/export/signals')
+def export_signals():
+    """خروجی جریانی سیگنالها و اعتبارسنجی: ?since=&until=&format=ndjson|csv&gzip=1&archive=1"""
+    fmt = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip', '0') in ('1', 'true')
+    try:
+        chunks = exporter.export(
+            fmt,
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            symbol=request.args.get('symbol'),
+            signal_type=request.args.get('type'),
+            include_archive=request.args.get('archive', '0') in ('1', 'true'),
+            compress=compress
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = f"signals.{fmt}" + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else exporter.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @app.route('/api/pump-dump/history')
 def get_pump_dump_history():
     hours = request.args.get('hours', 24, type=int)
-    alerts = signal_db.get_pump_dump_history(hours)
+    alerts = hot_tier.get_pump_dump_history(hours)
     return jsonify(alerts)
 
+@app.route('/api/signals/<int:signal_id>/validations')
+def get_signal_validations(signal_id):
+    return jsonify(hot_tier.get_signal_validations(signal_id))
+
+@app.route('/api/prescreen')
+def get_prescreen():
+    return jsonify(prescreen.get_flagged())
+
+@app.route('/api/order-blocks/<symbol>')
+def get_order_blocks(symbol):
+    symbol = symbol.replace('_', '/')
+    return jsonify(zone_index.get_zones(symbol))
+
+@app.route('/api/pipeline')
+def get_pipeline_metrics():
+    return jsonify(pipeline_metrics())
+
+@app.route('/api/metrics')
+def get_metrics():
+    # پردازههای فرزند (supervisor یا METRICS_TARGETS دستی: host:port,...)
+    targets = [t for t in os.environ.get('METRICS_TARGETS', '').split(',') if t]
+    if targets:
+        text = merge([registry.render(process='web')] + scrape(targets))
+    else:
+        text = registry.render()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/perf/cycles')
+def get_perf_cycles():
+    traces = signal_db.get_perf_traces(
+        kind=request.args.get('kind'),
+        hours=request.args.get('hours', 24, type=int),
+        limit=request.args.get('limit', 50, type=int),
+        symbol=request.args.get('symbol'),
+        min_duration_ms=request.args.get('min_duration_ms', type=float)
+    )
+    return jsonify(traces)
+
 @app.route('/api/movers')
 def get_movers():
-    return jsonify(cache['movers'])
+    return serve_snapshot('movers')
+
+@app.route('/api/leaderboard')
+def get_leaderboard():
+    side = request.args.get('side')
+    limit = request.args.get('limit', 20, type=int)
+    if side in ('buy', 'sell'):
+        return jsonify(leaderboard.top(side, limit))
+    return jsonify(leaderboard.snapshot(limit))
+
+@app.route('/api/leaderboard/<symbol>')
+def get_leaderboard_rank(symbol):
+    symbol = symbol.replace('_', '/')
+    return jsonify(leaderboard.rank(symbol) or {'symbol': symbol, 'recommendation': 'NEUTRAL'})
 
 @app.route('/api/stats')
 def get_stats():
-    stats = signal_db.get_statistics()
+    stats = signal_db.get_statistics(request.args.get('days', 0, type=int))
     return jsonify(stats)
 
 @app.route('/api/exchange/change', methods=['POST'])
@@ -126,17 +251,20 @@ def change_exchange():
     data = request.json
     new_exchange = data.get('exchange', 'kucoin')
     
-    success = exchange_manager.change_exchange(new_exchange)
+    # صرافی جدید در پسزمینه آماده و در مرز چرخه بعدی اسکن جایگزین میشود
+    success = exchange_manager.prepare_switch(new_exchange, scanner.timeframe)
     if success:
-        exchange_manager.load_symbols()
-        return jsonify({'success': True, 'exchange': new_exchange})
+        # اسکنر و اعتبارسنج در پردازههای جدا از همین مقدار پیروی میکنند
+        signal_db.set_runtime_value('exchange', new_exchange)
+        return jsonify({'success': True, 'exchange': new_exchange, 'status': 'pending'})
     return jsonify({'success': False})
 
 @app.route('/api/exchanges')
 def get_exchanges():
     return jsonify({
         'current': exchange_manager.exchange_id,
-        'available': list(exchange_manager.SUPPORTED_EXCHANGES.keys())
+        'available': list(exchange_manager.SUPPORTED_EXCHANGES.keys()),
+        'switch': exchange_manager.switch_status()
     })
 
 @app.route('/api/symbols')
@@ -178,17 +306,63 @@ def handle_subscribe(data):
         emit('subscribed', {'symbol': symbol})
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Crypto Futures Signal System')
+    parser.add_argument('--mode', choices=['all', 'web', 'supervised'], default='all',
+                        help="all: scanner in this process | web: receive from scanner.py shards | "
+                             "supervised: web, scanner and validator as separate processes")
+    parser.add_argument('--no-validator', action='store_true',
+                        help='validator runs in its own process (python signal_validator.py)')
+    parser.add_argument('--scanners', type=int, default=1, help='scanner processes in supervised mode')
+    args = parser.parse_args()
+    
+    if args.mode == 'supervised':
+        from supervisor import main as supervise
+        supervise(args.scanners)
+        raise SystemExit(0)
+    
     print("🚀 Starting Crypto Futures Signal System...")
     
-    # بارگذاری ارزها
+    # صرافی ذخیره شده و بارگذاری ارزها
+    follow_exchange()
     exchange_manager.load_symbols(250)
     
-    # شروع اعتبارسنجی
-    validator.start()
+    # شروع اعتبارسنجی و نگهداری دیتابیس
+    if not args.no_validator:
+        validator.start()
+        retention.start()
     
-    # شروع اسکنر
-    scanner_thread = threading.Thread(target=scan_all_symbols, daemon=True)
-    scanner_thread.start()
+    # 24 ساعت اخیر تاریخچه در حافظه
+    hot_tier.start()
+    
+    broadcaster.attach_socketio(socketio)
+    
+    if args.mode == 'web':
+        # اسکنرها در پردازههای جدا (python scanner.py --shard)
+        broadcaster.on('cache_update', merge_shard_cache)
+        broadcaster.on('leaderboard_update', merge_shard_leaderboard)
+        broadcaster.on('prescreen_update', merge_shard_prescreen)
+        broadcaster.on('pipeline_update', merge_shard_pipeline)
+        broadcaster.listen()
+    else:
+        # شروع گرم: کش و وضعیت از آخرین checkpoint تا اسکن اول
+        checkpoint.restore()
+        
+        # شروع پیشغربالگری تیکرها
+        prescreen.start()
+        
+        # شروع استخر تحلیل و اسکنر
+        analysis_executor.start()
+        scanner.set_emitter(broadcaster.emit)
+        scanner.start()
+        checkpoint.start()
     
     print("📊 Server running on http://localhost:5000")
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False)
+    try:
+        socketio.run(app, host='0.0.0.0', port=5000, debug=False)
+    finally:
+        hot_tier.stop()
+        if args.mode == 'all':
+            scanner.stop()
+            checkpoint.stop()
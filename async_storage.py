@@ -0,0 +1,84 @@
+"""
+رابط asyncio برای SignalDatabase و Database
+هر متد روی thread اختصاصی I/O اجرا میشود؛ event loop منتظر دیسک نمیماند
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import time
+
+from metrics import registry
+
+ASYNC_SECONDS = registry.histogram('storage_async_seconds', 'Async storage call duration including executor wait',
+                                   ['storage', 'method'])
+
+
+class AsyncStorage:
+    """نسخه async متدهای ذخیرهسازی
+
+    نوشتنها به ترتیب روی یک thread (همان تک نویسنده SQLite) و خواندنها روی چند thread همزمان
+    """
+
+    def __init__(self, backend, name, reads, writes, readers=4):
+        self.backend = backend
+        self.name = name
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix=f'{name}-write')
+        self.read_executor = ThreadPoolExecutor(readers, thread_name_prefix=f'{name}-read')
+
+    def _executor(self, method):
+        if method in self.writes:
+            return self.write_executor
+        if method in self.reads:
+            return self.read_executor
+        raise AttributeError(f"{self.name} has no async method '{method}'")
+
+    async def call(self, method, *args, **kwargs):
+        executor = self._executor(method)
+        fn = functools.partial(getattr(self.backend, method), *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn)
+        finally:
+            ASYNC_SECONDS.observe(time.perf_counter() - started, storage=self.name, method=method)
+
+    def __getattr__(self, method):
+        # await storage.save_signal(...) == storage.call('save_signal', ...)
+        if method.startswith('_') or method not in self.reads | self.writes:
+            raise AttributeError(method)
+        return functools.partial(self.call, method)
+
+    async def batch(self, calls):
+        """چند نوشتن در یک نوبت thread: [(method, args, kwargs), ...] -> لیست نتیجهها
+
+        خطای هر فراخوانی به جای نتیجه آن برگردانده میشود (مثل gather با return_exceptions)
+        """
+        calls = [(call[0], tuple(call[1]) if len(call) > 1 else (), dict(call[2]) if len(call) > 2 else {})
+                 for call in calls]
+        for method, _, _ in calls:
+            if method not in self.writes:
+                raise AttributeError(f"{self.name} has no async write method '{method}'")
+
+        def run():
+            results = []
+            for method, args, kwargs in calls:
+                try:
+                    results.append(getattr(self.backend, method)(*args, **kwargs))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.write_executor, run)
+        finally:
+            ASYNC_SECONDS.observe(time.perf_counter() - started, storage=self.name, method='batch')
+
+    async def close(self):
+        """ذخیره صفهای write-behind و بستن threadها"""
+        if 'flush_writes' in self.writes:
+            await self.call('flush_writes')
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self.write_executor.shutdown, wait=True))
+        await loop.run_in_executor(None, functools.partial(self.read_executor.shutdown, wait=True))
@@ -0,0 +1,142 @@
+"""
+کانال ارسال رویدادها به کلاینتها
+در پردازه وب مستقیم با socketio؛ در پردازههای اسکنر از طریق multiprocessing.connection به پردازه وب
+پیامها JSON هستند (نه pickle)؛ اتصال با authkey احراز هویت میشود
+"""
+from multiprocessing.connection import Listener, Client
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+
+from metrics import registry
+from snapshot import SocketJSON
+
+SOCKET_EMITS = registry.counter('socket_emits_total', 'Events emitted to socket clients', ['event', 'target'])
+BROADCAST_DROPPED = registry.counter('broadcast_dropped_total', 'Events dropped because the web process was unreachable')
+
+# BROADCAST_HOST=0.0.0.0 برای اسکنرهای روی میزبانهای دیگر (نیاز به BROADCAST_AUTHKEY)
+DEFAULT_ADDRESS = (os.environ.get('BROADCAST_HOST', '127.0.0.1'), int(os.environ.get('BROADCAST_PORT', 5001)))
+DEFAULT_AUTHKEY = os.environ.get('BROADCAST_AUTHKEY', '').encode() or None
+LOCAL_AUTHKEY = b'crypto_futures_broadcast'
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def _authkey(host, authkey):
+    """کلید پیشفرض فقط روی loopback؛ آدرس شبکه بدون BROADCAST_AUTHKEY شروع نمیشود"""
+    if authkey:
+        return authkey
+    if not _is_loopback(host):
+        raise RuntimeError(f"BROADCAST_AUTHKEY must be set to use the broadcast channel on {host}")
+    return LOCAL_AUTHKEY
+
+
+class Broadcaster:
+    """ارسال رویداد (event, data) به کلاینتهای socketio"""
+
+    def __init__(self, origin=None):
+        self.origin = origin or f'{socket.gethostname()}:{os.getpid()}'
+        self.socketio = None
+        self.address = None
+        self.authkey = None
+        self.conn = None
+        self.lock = threading.Lock()
+        self.handlers = {}
+        self.listener = None
+        self.dropped = 0
+        self.retry_at = 0
+
+    # ---------- سمت وب ----------
+
+    def attach_socketio(self, socketio):
+        """ارسال مستقیم در همین پردازه"""
+        self.socketio = socketio
+
+    def on(self, event, handler):
+        """پردازش رویدادهای دریافتی از پردازههای دیگر قبل از ارسال به کلاینتها"""
+        self.handlers[event] = handler
+
+    def listen(self, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+        """دریافت رویداد از پردازههای اسکنر"""
+        self.listener = Listener(address, authkey=_authkey(address[0], authkey))
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        print(f"📡 Broadcast listener on {address[0]}:{address[1]}")
+
+    def _accept_loop(self):
+        while self.listener is not None:
+            try:
+                conn = self.listener.accept()
+                threading.Thread(target=self._receive_loop, args=(conn,), daemon=True).start()
+            except Exception as e:
+                print(f"Broadcast accept error: {e}")
+                time.sleep(1)
+
+    def _receive_loop(self, conn):
+        try:
+            while True:
+                # فقط JSON؛ هیچ داده دریافتی unpickle نمیشود
+                event, data, origin = json.loads(conn.recv_bytes())
+                handler = self.handlers.get(event)
+                if handler is not None:
+                    data = handler(origin, data)
+                if data is not None:
+                    self._emit_local(event, data)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    # ---------- سمت اسکنر ----------
+
+    def connect(self, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+        """ارسال رویدادها به پردازه وب"""
+        self.authkey = _authkey(address[0], authkey)
+        self.address = address
+
+    def _send_remote(self, event, data):
+        with self.lock:
+            if self.conn is None:
+                if time.time() < self.retry_at:
+                    self.dropped += 1
+                    BROADCAST_DROPPED.inc()
+                    return
+                try:
+                    self.conn = Client(self.address, authkey=self.authkey)
+                except Exception as e:
+                    # وب در دسترس نیست؛ رویداد از دست میرود ولی اسکن ادامه دارد
+                    self.retry_at = time.time() + 5
+                    self.dropped += 1
+                    BROADCAST_DROPPED.inc()
+                    return
+            try:
+                # RawJSON (کش از پیش ساخته شده) بدون serialize دوباره
+                self.conn.send_bytes(SocketJSON.dumps([event, data, self.origin]).encode())
+                SOCKET_EMITS.inc(event=event, target='remote')
+            except Exception as e:
+                self.conn = None
+                self.dropped += 1
+                BROADCAST_DROPPED.inc()
+
+    def _emit_local(self, event, data):
+        if self.socketio is not None:
+            self.socketio.emit(event, data)
+            SOCKET_EMITS.inc(event=event, target='local')
+
+    def emit(self, event, data=None):
+        """ارسال رویداد"""
+        if self.address is not None:
+            self._send_remote(event, data)
+        else:
+            self._emit_local(event, data)
+
+
+# نمونه گلوبال
+broadcaster = Broadcaster()
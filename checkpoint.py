@@ -0,0 +1,158 @@
+"""
+ذخیره دورهای وضعیت اسکنر برای شروع گرم بعد از ری‌استارت
+کش، کندلها، ناحیهها، پیوتها، جدول امتیاز و ایندکس تکراریها در یک فایل فشرده (pickle + zlib)
+"""
+from collections import OrderedDict
+import os
+import pickle
+import threading
+import time
+import zlib
+
+from data_fetcher import exchange_manager
+from leaderboard import leaderboard
+from order_blocks import zone_index
+from pivots import pivot_index
+from metrics import registry
+
+CHECKPOINT_SECONDS = registry.histogram('checkpoint_seconds', 'Checkpoint save/restore duration', ['op'])
+CHECKPOINT_BYTES = registry.gauge('checkpoint_bytes', 'Size of the last saved checkpoint')
+
+FORMAT_VERSION = 2
+
+
+class StateCheckpoint:
+    """ذخیره و بازیابی وضعیت در حافظه"""
+
+    def __init__(self, scanner, path='scanner_state.ckpt', interval=300, max_age=6 * 3600):
+        self.scanner = scanner
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age      # checkpoint قدیمیتر از این استفاده نمیشود
+        self.running = False
+        self.thread = None
+        self.saved_at = None
+        self.restored_at = None
+
+    def collect(self):
+        """جمعآوری وضعیت فعلی"""
+        scanner = self.scanner
+        context = exchange_manager.context
+        with context.candles_lock:
+            candles = dict(context.candles)
+        with scanner.latest_lock:
+            latest = list(scanner.latest.items())
+        with scanner.seen_lock:
+            seen = list(scanner.seen.keys())
+        # ساختارهایی که درجا تغییر میکنند زیر قفل خودشان serialize میشوند
+        with leaderboard.lock:
+            board = pickle.dumps((leaderboard.ranked, leaderboard.entries), protocol=pickle.HIGHEST_PROTOCOL)
+        # ناحیهها در دیتابیس هستند؛ فقط آخرین کندل بررسی شده هر ارز
+        zones = zone_index.last_seen()
+        with pivot_index.lock:
+            pivots = pickle.dumps(pivot_index.states, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return {
+            'version': FORMAT_VERSION,
+            'saved_at': time.time(),
+            'exchange': context.exchange_id,
+            'timeframe': scanner.timeframe,
+            'cache': dict(scanner.cache.data),
+            'latest': latest,
+            'seen': seen,
+            'carry_over': list(scanner.carry_over),
+            'candles': candles,
+            'leaderboard': board,
+            'zones': zones,
+            'pivots': pivots
+        }
+
+    def save(self):
+        """نوشتن اتمی checkpoint"""
+        with CHECKPOINT_SECONDS.time(op='save'):
+            state = self.collect()
+            blob = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 3)
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, self.path)
+        self.saved_at = state['saved_at']
+        CHECKPOINT_BYTES.set(len(blob))
+        return len(blob)
+
+    def load(self):
+        """خواندن checkpoint؛ None اگر وجود نداشته باشد یا قابل استفاده نباشد"""
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"❌ Error reading checkpoint: {e}")
+            return None
+
+        if state.get('version') != FORMAT_VERSION:
+            return None
+        if time.time() - state['saved_at'] > self.max_age:
+            print("⏭️ Checkpoint too old, cold start")
+            return None
+        if state['exchange'] != exchange_manager.exchange_id or state['timeframe'] != self.scanner.timeframe:
+            print("⏭️ Checkpoint from another exchange/timeframe, cold start")
+            return None
+        return state
+
+    def restore(self):
+        """بازیابی وضعیت؛ اسکن بعدی فقط فاصله از زمان checkpoint را میگیرد"""
+        with CHECKPOINT_SECONDS.time(op='restore'):
+            state = self.load()
+            if state is None:
+                return False
+
+            scanner = self.scanner
+            context = exchange_manager.context
+            with context.candles_lock:
+                context.candles.update(state['candles'])
+            with scanner.latest_lock:
+                scanner.latest = OrderedDict(state['latest'])
+            with scanner.seen_lock:
+                scanner.seen = OrderedDict((key, True) for key in state['seen'])
+            scanner.carry_over = state['carry_over']
+            with leaderboard.lock:
+                leaderboard.ranked, leaderboard.entries = pickle.loads(state['leaderboard'])
+            zone_index.restore(state['zones'])
+            with pivot_index.lock:
+                pivot_index.states.update(pickle.loads(state['pivots']))
+
+            scanner.snapshots.publish(**state['cache'])
+
+        self.restored_at = time.time()
+        age = int(self.restored_at - state['saved_at'])
+        print(f"♻️ Restored checkpoint ({len(state['latest'])} symbols, "
+              f"{len(state['candles'])} candle windows, {age}s old)")
+        return True
+
+    def run_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            if not self.running:
+                break
+            try:
+                size = self.save()
+                print(f"💾 Checkpoint saved ({size / 1024:.0f} KB)")
+            except Exception as e:
+                print(f"Checkpoint error: {e}")
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """توقف و ذخیره آخرین وضعیت"""
+        self.running = False
+        try:
+            self.save()
+        except Exception as e:
+            print(f"Checkpoint error: {e}")
+
@@ -6,8 +6,39 @@ import ccxt
 import pandas as pd
 from datetime import datetime
 import time
+import threading
 import asyncio
 
+from metrics import registry
+
+FETCH_SECONDS = registry.histogram('exchange_request_seconds', 'Exchange request latency', ['method'])
+EXCHANGE_ERRORS = registry.counter('exchange_errors_total', 'Failed exchange requests', ['method', 'kind'])
+
+
+def record_exchange_error(method, error):
+    """شمارش خطای صرافی به تفکیک نوع"""
+    if isinstance(error, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+        kind = 'rate_limit'
+    elif isinstance(error, ccxt.NetworkError):
+        kind = 'network'
+    elif isinstance(error, ccxt.ExchangeError):
+        kind = 'exchange'
+    else:
+        kind = 'other'
+    EXCHANGE_ERRORS.inc(method=method, kind=kind)
+
+class ExchangeContext:
+    """صرافی، بازارها، لیست ارزها و کش کندلها؛ یک واحد که یکجا جایگزین میشود"""
+
+    def __init__(self, exchange_id, exchange):
+        self.exchange_id = exchange_id
+        self.exchange = exchange
+        self.symbols = []
+        self.candles = {}           # (symbol, timeframe) -> DataFrame
+        self.candles_lock = threading.Lock()
+        self.created_at = time.time()
+
+
 class ExchangeManager:
     """مدیریت صرافیها"""
     
@@ -45,19 +76,36 @@ class ExchangeManager:
     }
     
     def __init__(self, exchange_id='kucoin'):
-        self.exchange_id = exchange_id
-        self.exchange = None
-        self.symbols = []
-        self.init_exchange()
-    
-    def init_exchange(self):
+        self.symbol_limit = 250
+        self.context = self.create_context(exchange_id)
+        self.pending = None
+        self.pending_id = None
+        self.switch_error = None
+        self.switch_lock = threading.Lock()
+        # اگر اسکنر فعال باشد، جابجایی فقط در مرز چرخه (commit_pending)
+        self.deferred_commit = False
+
+    # کانتکست فعلی؛ با هر جابجایی کل شیء عوض میشود
+    @property
+    def exchange_id(self):
+        return self.context.exchange_id
+
+    @property
+    def exchange(self):
+        return self.context.exchange
+
+    @property
+    def symbols(self):
+        return self.context.symbols
+
+    def create_context(self, exchange_id):
         """راهاندازی صرافی"""
-        if self.exchange_id not in self.SUPPORTED_EXCHANGES:
-            self.exchange_id = 'kucoin'
-        
+        if exchange_id not in self.SUPPORTED_EXCHANGES:
+            exchange_id = 'kucoin'
+
         try:
-            exchange_info = self.SUPPORTED_EXCHANGES[self.exchange_id]
-            self.exchange = exchange_info['class']({
+            exchange_info = self.SUPPORTED_EXCHANGES[exchange_id]
+            exchange = exchange_info['class']({
                 'enableRateLimit': True,
                 'options': {'defaultType': 'swap'}
             })
@@ -65,55 +113,149 @@ class ExchangeManager:
         except Exception as e:
             print(f"❌ Error connecting: {e}")
             # Fallback to KuCoin
-            self.exchange = ccxt.kucoinfutures({'enableRateLimit': True})
-    
-    def change_exchange(self, new_exchange_id):
-        """تغییر صرافی"""
+            exchange_id = 'kucoin'
+            exchange = ccxt.kucoinfutures({'enableRateLimit': True})
+        return ExchangeContext(exchange_id, exchange)
+
+    def change_exchange(self, new_exchange_id, load=True):
+        """تغییر صرافی (همزمان)"""
         if new_exchange_id in self.SUPPORTED_EXCHANGES:
-            self.exchange_id = new_exchange_id
-            self.init_exchange()
-            self.load_symbols()
+            context = self.create_context(new_exchange_id)
+            if load:
+                self._load_symbols(context, self.symbol_limit)
+            self.context = context
             return True
         return False
-    
+
+    def prepare_switch(self, new_exchange_id, timeframe='15m', warm_symbols=20):
+        """ساخت صرافی جدید در پسزمینه؛ درخواست کاربر منتظر نمیماند"""
+        if new_exchange_id not in self.SUPPORTED_EXCHANGES:
+            return False
+        with self.switch_lock:
+            if self.pending_id == new_exchange_id:
+                return True
+            self.pending_id = new_exchange_id
+            self.pending = None
+            self.switch_error = None
+
+        threading.Thread(
+            target=self._build_pending, args=(new_exchange_id, timeframe, warm_symbols), daemon=True
+        ).start()
+        return True
+
+    def _build_pending(self, exchange_id, timeframe, warm_symbols):
+        try:
+            context = self.create_context(exchange_id)
+            self._load_symbols(context, self.symbol_limit)
+            # گرم کردن کش کندل ارزهای اول تا اسکن اول روی صرافی جدید سریع باشد
+            for symbol in context.symbols[:warm_symbols]:
+                if self.pending_id != exchange_id:
+                    return
+                self.fetch_ohlcv(symbol, timeframe, 200, context=context)
+        except Exception as e:
+            with self.switch_lock:
+                if self.pending_id == exchange_id:
+                    self.pending_id = None
+                    self.switch_error = str(e)
+            print(f"❌ Exchange switch to {exchange_id} failed: {e}")
+            return
+
+        with self.switch_lock:
+            if self.pending_id != exchange_id:
+                return  # درخواست جدیدتری رسیده
+            self.pending = context
+        print(f"🔁 {exchange_id} ready ({len(context.symbols)} symbols, {len(context.candles)} warm)")
+        if not self.deferred_commit:
+            self.commit_pending()
+
+    def commit_pending(self):
+        """جابجایی اتمی به صرافی آماده؛ True اگر صرافی عوض شد"""
+        with self.switch_lock:
+            context = self.pending
+            if context is None:
+                return False
+            self.pending = None
+            self.pending_id = None
+            previous = self.context
+            self.context = context
+        print(f"🔀 Exchange switched {previous.exchange_id} → {context.exchange_id}")
+        return True
+
+    def switch_status(self):
+        with self.switch_lock:
+            return {
+                'current': self.context.exchange_id,
+                'pending': self.pending_id,
+                'ready': self.pending is not None,
+                'error': self.switch_error
+            }
+
     def load_symbols(self, limit=250):
         """بارگذاری لیست ارزها"""
+        self.symbol_limit = limit
+        return self._load_symbols(self.context, limit)
+
+    def _load_symbols(self, context, limit):
         try:
-            self.exchange.load_markets()
+            context.exchange.load_markets()
             
             futures_symbols = []
-            for symbol, market in self.exchange.markets.items():
+            for symbol, market in context.exchange.markets.items():
                 if market.get('swap') or market.get('future'):
                     if market.get('active', True):
                         futures_symbols.append(symbol)
             
             # مرتبسازی و محدود کردن
-            self.symbols = futures_symbols[:limit]
-            print(f"📊 Loaded {len(self.symbols)} futures symbols from {self.exchange_id}")
-            return self.symbols
+            context.symbols = futures_symbols[:limit]
+            print(f"📊 Loaded {len(context.symbols)} futures symbols from {context.exchange_id}")
         except Exception as e:
             print(f"❌ Error loading symbols: {e}")
-            self.symbols = ['BTC/USDT:USDT', 'ETH/USDT:USDT']
-            return self.symbols
+            context.symbols = ['BTC/USDT:USDT', 'ETH/USDT:USDT']
+        return context.symbols
     
-    def fetch_ohlcv(self, symbol, timeframe='15m', limit=200):
-        """دریافت کندلها"""
+    def fetch_ohlcv(self, symbol, timeframe='15m', limit=200, context=None):
+        """دریافت کندلها؛ اگر در کش باشد فقط کندلهای جدید گرفته میشود"""
+        context = context or self.context
+        key = (symbol, timeframe)
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            with context.candles_lock:
+                cached = context.candles.get(key)
+
+            since = None
+            if cached is not None and len(cached) >= limit:
+                last = int(cached['timestamp'].iloc[-1].value // 1_000_000)
+                # اگر فاصله از کندل آخر بیشتر از limit کندل باشد، دریافت کامل
+                if time.time() * 1000 - last < (limit - 1) * context.exchange.parse_timeframe(timeframe) * 1000:
+                    since = last
+
+            with FETCH_SECONDS.time(method='fetch_ohlcv'):
+                ohlcv = context.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
             
             df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
             df['symbol'] = symbol
-            
-            return df
+
+            if since is not None and not df.empty:
+                # کندل آخر کش (ناتمام) با نسخه جدید جایگزین میشود
+                old = cached[cached['timestamp'] < df['timestamp'].iloc[0]]
+                df = pd.concat([old, df], ignore_index=True).tail(limit).reset_index(drop=True)
+            elif since is not None:
+                df = cached
+
+            if not df.empty:
+                with context.candles_lock:
+                    context.candles[key] = df
+            return df.copy()
         except Exception as e:
+            record_exchange_error('fetch_ohlcv', e)
             print(f"❌ Error fetching {symbol}: {e}")
             return pd.DataFrame()
     
     def get_ticker(self, symbol):
         """دریافت قیمت لحظهای"""
         try:
-            ticker = self.exchange.fetch_ticker(symbol)
+            with FETCH_SECONDS.time(method='fetch_ticker'):
+                ticker = self.exchange.fetch_ticker(symbol)
             return {
                 'symbol': symbol,
                 'price': ticker.get('last', 0),
@@ -122,15 +264,18 @@ class ExchangeManager:
                 'high_24h': ticker.get('high', 0),
                 'low_24h': ticker.get('low', 0)
             }
-        except:
+        except Exception as e:
+            record_exchange_error('fetch_ticker', e)
             return None
     
     def get_all_tickers(self):
         """دریافت همه قیمتها"""
         try:
-            tickers = self.exchange.fetch_tickers()
+            with FETCH_SECONDS.time(method='fetch_tickers'):
+                tickers = self.exchange.fetch_tickers()
             return tickers
-        except:
+        except Exception as e:
+            record_exchange_error('fetch_tickers', e)
             return {}
     
     def get_top_movers(self, limit=20):
@@ -2,15 +2,117 @@
 مدیریت دیتابیس SQLite برای ذخیره سیگنالها و اعتبارسنجی
 """
 import sqlite3
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import json
+import os
 import threading
 
+from async_storage import AsyncStorage
+from metrics import registry
+from write_behind import WriteBehindQueue
+
+DB_WRITE_SECONDS = registry.histogram('db_write_seconds', 'SQLite write latency including commit', ['op'])
+DB_READERS = registry.gauge('db_reader_connections', 'Open SQLite reader connections', ['state'])
+
+class ConnectionPool:
+    """اتصالهای ماندگار WAL: یک نویسنده (با قفل) و چند خواننده همزمان"""
+    
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-20000',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA mmap_size=67108864',
+        'PRAGMA busy_timeout=5000'
+    )
+    
+    def __init__(self, db_path, max_readers=8):
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self.write_lock = threading.RLock()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.writer = None
+        self.readers = []
+        self.open_readers = 0
+    
+    def connect(self, readonly=False):
+        # cached_statements: دستورهای آماده شده روی اتصال ماندگار دوباره استفاده میشوند
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
+    
+    def _check_fork(self):
+        """اتصالها بین پردازهها مشترک نمیشوند"""
+        if os.getpid() != self.pid:
+            self.pid = os.getpid()
+            self.writer = None
+            self.readers = []
+            self.open_readers = 0
+    
+    @contextmanager
+    def write(self):
+        """اتصال نویسنده؛ در صورت خطا تراکنش برگردانده میشود"""
+        with self.write_lock:
+            self._check_fork()
+            if self.writer is None:
+                self.writer = self.connect()
+            try:
+                yield self.writer
+            except Exception:
+                self.writer.rollback()
+                raise
+    
+    @contextmanager
+    def read(self):
+        """یک اتصال خواننده از استخر"""
+        with self.lock:
+            self._check_fork()
+            conn = self.readers.pop() if self.readers else None
+            if conn is None:
+                self.open_readers += 1
+        if conn is None:
+            conn = self.connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            with self.lock:
+                if len(self.readers) < self.max_readers:
+                    self.readers.append(conn)
+                    conn = None
+                else:
+                    self.open_readers -= 1
+            if conn is not None:
+                conn.close()
+    
+    def stats(self):
+        with self.lock:
+            idle = len(self.readers)
+            return {('idle',): idle, ('busy',): self.open_readers - idle}
+    
+    def close(self):
+        with self.write_lock, self.lock:
+            for conn in self.readers + ([self.writer] if self.writer else []):
+                conn.close()
+            self.writer = None
+            self.readers = []
+            self.open_readers = 0
+
 class SignalDatabase:
     def __init__(self, db_path='signals.db'):
         self.db_path = db_path
-        self.lock = threading.Lock()
+        self.pool = ConnectionPool(db_path)
+        self.lock = self.pool.write_lock
+        self.signal_writer = WriteBehindQueue('signals', self.save_signals)
+        self.pump_dump_writer = WriteBehindQueue('pump_dump_alerts', self.save_pump_dumps)
         self.init_db()
+        DB_READERS.func = self.pool.stats
     
     def get_connection(self):
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
@@ -90,82 +192,333 @@ class SignalDatabase:
                 )
             ''')
             
+            # جدول ناحیههای Order Block
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS order_block_zones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT NOT NULL,
+                    direction TEXT NOT NULL,
+                    top REAL NOT NULL,
+                    bottom REAL NOT NULL,
+                    strength INTEGER DEFAULT 50,
+                    formed_at TIMESTAMP NOT NULL,
+                    expires_at TIMESTAMP NOT NULL,
+                    status TEXT DEFAULT 'ACTIVE',
+                    retests INTEGER DEFAULT 0,
+                    last_retest_at TIMESTAMP,
+                    UNIQUE (symbol, direction, formed_at)
+                )
+            ''')
+            
+            # جدول trace چرخههای اسکن و اعتبارسنجی (فقط افزودنی)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS perf_traces (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    started_at TIMESTAMP NOT NULL,
+                    ended_at TIMESTAMP NOT NULL,
+                    duration_ms REAL,
+                    exchange TEXT,
+                    items INTEGER DEFAULT 0,
+                    bars_fetched INTEGER DEFAULT 0,
+                    signals_produced INTEGER DEFAULT 0,
+                    rows_written INTEGER DEFAULT 0,
+                    errors INTEGER DEFAULT 0,
+                    detail TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_perf_traces_started ON perf_traces (kind, started_at)')
+            
+            # تنظیمات مشترک بین پردازهها (مثلا صرافی فعال)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS runtime_config (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            self.migrate(conn)
+            
             conn.commit()
             conn.close()
     
+    # ---------- آمار تجمعی (بروزرسانی در همان تراکنش نوشتن) ----------
+    
+    @staticmethod
+    def _bump_stats(conn, day, signal_type, signals=0, closed=0, wins=0, losses=0, stopped=0, profit=0.0):
+        """افزودن به آمار روز و آمار نوع سیگنال ('*' = همه انواع)"""
+        win_rate = 100.0 * wins / closed if closed else 0
+        conn.execute('''
+            INSERT INTO signal_stats 
+            (date, total_signals, closed_signals, successful_signals, failed_signals, 
+             stopped_signals, total_profit, win_rate)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                total_signals = total_signals + excluded.total_signals,
+                closed_signals = closed_signals + excluded.closed_signals,
+                successful_signals = successful_signals + excluded.successful_signals,
+                failed_signals = failed_signals + excluded.failed_signals,
+                stopped_signals = stopped_signals + excluded.stopped_signals,
+                total_profit = total_profit + excluded.total_profit,
+                win_rate = CASE WHEN closed_signals + excluded.closed_signals > 0
+                    THEN 100.0 * (successful_signals + excluded.successful_signals)
+                         / (closed_signals + excluded.closed_signals)
+                    ELSE 0 END
+        ''', (day, signals, closed, wins, losses, stopped, profit, win_rate))
+        
+        now = datetime.utcnow().isoformat()
+        conn.executemany('''
+            INSERT INTO signal_type_stats 
+            (signal_type, total_signals, closed_signals, successful_signals, failed_signals, 
+             stopped_signals, total_profit, win_rate, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(signal_type) DO UPDATE SET
+                total_signals = total_signals + excluded.total_signals,
+                closed_signals = closed_signals + excluded.closed_signals,
+                successful_signals = successful_signals + excluded.successful_signals,
+                failed_signals = failed_signals + excluded.failed_signals,
+                stopped_signals = stopped_signals + excluded.stopped_signals,
+                total_profit = total_profit + excluded.total_profit,
+                win_rate = CASE WHEN closed_signals + excluded.closed_signals > 0
+                    THEN 100.0 * (successful_signals + excluded.successful_signals)
+                         / (closed_signals + excluded.closed_signals)
+                    ELSE 0 END,
+                updated_at = excluded.updated_at
+        ''', [
+            (key, signals, closed, wins, losses, stopped, profit, win_rate, now)
+            for key in (signal_type, '*')
+        ])
+    
+    @staticmethod
+    def _closed_counts(status, profit):
+        return {
+            'closed': 1,
+            'wins': int(status == 'SUCCESS'),
+            'losses': int(status == 'FAILED'),
+            'stopped': int(status == 'STOPPED'),
+            'profit': profit or 0.0
+        }
+    
+    def _backfill_stats(self, conn):
+        """ساخت آمار از سیگنالهای موجود (یکبار هنگام مهاجرت)"""
+        for row in conn.execute('''
+            SELECT DATE(created_at) AS day, signal_type, COUNT(*) AS n
+            FROM signals GROUP BY day, signal_type
+        ''').fetchall():
+            self._bump_stats(conn, row[0], row[1], signals=row[2])
+        
+        for row in conn.execute('''
+            SELECT DATE(closed_at) AS day, signal_type, validation_result, COUNT(*) AS n, 
+                   SUM(profit_loss) AS profit
+            FROM signals WHERE validated = 1 
+            GROUP BY day, signal_type, validation_result
+        ''').fetchall():
+            day, signal_type, status, n, profit = tuple(row)
+            self._bump_stats(
+                conn, day, signal_type, closed=n,
+                wins=n if status == 'SUCCESS' else 0,
+                losses=n if status == 'FAILED' else 0,
+                stopped=n if status == 'STOPPED' else 0,
+                profit=profit or 0.0
+            )
+    
+    # مهاجرتهای schema به ترتیب؛ شماره نسخه در PRAGMA user_version
+    MIGRATIONS = [
+        # 1: ایندکس مسیرهای پرس و جوی داشبورد
+        (
+            'CREATE INDEX IF NOT EXISTS idx_signals_status_created ON signals (status, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_signals_created ON signals (created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_signals_symbol_created ON signals (symbol, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_signals_type_created ON signals (signal_type, created_at)',
+            'CREATE INDEX IF NOT EXISTS idx_pump_dump_detected ON pump_dump_alerts (detected_at)',
+            'CREATE INDEX IF NOT EXISTS idx_validations_signal ON signal_validations (signal_id, check_time)'
+        ),
+        # 2: آمار تجمعی روزانه و به تفکیک نوع
+        (
+            'ALTER TABLE signal_stats ADD COLUMN closed_signals INTEGER DEFAULT 0',
+            'ALTER TABLE signal_stats ADD COLUMN stopped_signals INTEGER DEFAULT 0',
+            '''
+                CREATE TABLE IF NOT EXISTS signal_type_stats (
+                    signal_type TEXT PRIMARY KEY,
+                    total_signals INTEGER DEFAULT 0,
+                    closed_signals INTEGER DEFAULT 0,
+                    successful_signals INTEGER DEFAULT 0,
+                    failed_signals INTEGER DEFAULT 0,
+                    stopped_signals INTEGER DEFAULT 0,
+                    total_profit REAL DEFAULT 0,
+                    win_rate REAL DEFAULT 0,
+                    updated_at TIMESTAMP
+                )
+            ''',
+            _backfill_stats
+        ),
+        # 3: خلاصه اعتبارسنجی سیگنالهای بسته شده (بعد از حذف ردیفهای جزئی)
+        (
+            '''
+                CREATE TABLE IF NOT EXISTS validation_summaries (
+                    signal_id INTEGER PRIMARY KEY,
+                    checks INTEGER,
+                    first_check TIMESTAMP,
+                    last_check TIMESTAMP,
+                    first_price REAL,
+                    last_price REAL,
+                    min_price REAL,
+                    max_price REAL,
+                    min_change_pct REAL,
+                    max_change_pct REAL,
+                    final_status TEXT,
+                    seconds_to_close REAL
+                )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_signals_closed ON signals (status, closed_at)'
+        ),
+    ]
+    
+    def migrate(self, conn):
+        """اجرای مهاجرتهای اجرا نشده
+
+        چند پردازه همزمان شروع میشوند؛ هر مهاجرت با BEGIN IMMEDIATE (قفل نوشتن) و خواندن دوباره
+        user_version داخل همان تراکنش اجرا میشود تا فقط یک پردازه آن را اجرا کند
+        """
+        conn.commit()
+        # backfill ممکن است طول بکشد؛ پردازههای دیگر منتظر میمانند
+        conn.execute('PRAGMA busy_timeout = 120000')
+        for n, statements in enumerate(self.MIGRATIONS, start=1):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= n:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    if callable(statement):
+                        statement(self, conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {n}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"🗃️ Database migrated to schema v{n}")
+    
+    INSERT_SIGNAL = '''
+        INSERT INTO signals 
+        (symbol, signal_type, direction, entry_price, target_price, 
+         stop_loss, strength, reason, indicator_data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    INSERT_PUMP_DUMP = '''
+        INSERT INTO pump_dump_alerts 
+        (symbol, alert_type, price_at_alert, volume_change, 
+         price_change, strength)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    
+    @staticmethod
+    def _signal_row(signal_data):
+        return (
+            signal_data.get('symbol'),
+            signal_data.get('type', 'UNKNOWN'),
+            signal_data.get('signal', 'NEUTRAL'),
+            signal_data.get('price', 0),
+            signal_data.get('target'),
+            signal_data.get('stop_loss'),
+            signal_data.get('strength', 50),
+            signal_data.get('reason', ''),
+            json.dumps(signal_data.get('indicators', {}), default=str)
+        )
+    
+    @staticmethod
+    def _pump_dump_row(alert_data):
+        return (
+            alert_data.get('symbol'),
+            alert_data.get('alert_type'),
+            alert_data.get('price', 0),
+            alert_data.get('volume_change', 0),
+            alert_data.get('price_change', 0),
+            alert_data.get('strength', 50)
+        )
+    
+    @DB_WRITE_SECONDS.time(op='save_signal')
     def save_signal(self, signal_data):
-        with self.lock:
-            conn = self.get_connection()
+        with self.pool.write() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO signals 
-                (symbol, signal_type, direction, entry_price, target_price, 
-                 stop_loss, strength, reason, indicator_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                signal_data.get('symbol'),
-                signal_data.get('type', 'UNKNOWN'),
-                signal_data.get('signal', 'NEUTRAL'),
-                signal_data.get('price', 0),
-                signal_data.get('target'),
-                signal_data.get('stop_loss'),
-                signal_data.get('strength', 50),
-                signal_data.get('reason', ''),
-                json.dumps(signal_data.get('indicators', {}))
-            ))
-            
+            cursor.execute(self.INSERT_SIGNAL, self._signal_row(signal_data))
             signal_id = cursor.lastrowid
+            
+            self._bump_stats(conn, self._today(), signal_data.get('type', 'UNKNOWN'), signals=1)
             conn.commit()
-            conn.close()
             return signal_id
     
+    @DB_WRITE_SECONDS.time(op='save_pump_dump')
     def save_pump_dump(self, alert_data):
-        with self.lock:
-            conn = self.get_connection()
+        with self.pool.write() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO pump_dump_alerts 
-                (symbol, alert_type, price_at_alert, volume_change, 
-                 price_change, strength)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                alert_data.get('symbol'),
-                alert_data.get('alert_type'),
-                alert_data.get('price', 0),
-                alert_data.get('volume_change', 0),
-                alert_data.get('price_change', 0),
-                alert_data.get('strength', 50)
-            ))
+            cursor.execute(self.INSERT_PUMP_DUMP, self._pump_dump_row(alert_data))
             
             alert_id = cursor.lastrowid
             conn.commit()
-            conn.close()
             return alert_id
     
+    @DB_WRITE_SECONDS.time(op='save_signals')
+    def save_signals(self, signals):
+        """درج دستهای در یک تراکنش"""
+        with self.pool.write() as conn:
+            conn.executemany(self.INSERT_SIGNAL, [self._signal_row(s) for s in signals])
+            
+            day = self._today()
+            for signal_type, n in Counter(s.get('type', 'UNKNOWN') for s in signals).items():
+                self._bump_stats(conn, day, signal_type, signals=n)
+            conn.commit()
+    
+    @DB_WRITE_SECONDS.time(op='save_pump_dumps')
+    def save_pump_dumps(self, alerts):
+        with self.pool.write() as conn:
+            conn.executemany(self.INSERT_PUMP_DUMP, [self._pump_dump_row(a) for a in alerts])
+            conn.commit()
+    
+    # ---------- نوشتن با تاخیر ----------
+    
+    def enqueue_signal(self, signal_data):
+        """ذخیره در پسزمینه؛ فراخواننده منتظر دیسک نمیماند"""
+        self.signal_writer.put(signal_data)
+    
+    def enqueue_pump_dump(self, alert_data):
+        self.pump_dump_writer.put(alert_data)
+    
+    def flush_writes(self):
+        """انتظار تا ذخیره همه رکوردهای صف"""
+        self.signal_writer.flush()
+        self.pump_dump_writer.flush()
+    
+    def close(self):
+        self.signal_writer.stop()
+        self.pump_dump_writer.stop()
+        self.pool.close()
+    
     def get_active_signals(self, limit=100):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM signals 
-            WHERE status = 'ACTIVE'
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM signals 
+                WHERE status = 'ACTIVE'
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (limit,))
+            
+            rows = cursor.fetchall()
         return [dict(row) for row in rows]
     
+    @DB_WRITE_SECONDS.time(op='update_signal_validation')
     def update_signal_validation(self, signal_id, current_price, status, notes=''):
-        with self.lock:
-            conn = self.get_connection()
+        with self.pool.write() as conn:
             cursor = conn.cursor()
             
             # دریافت قیمت ورود
-            cursor.execute('SELECT entry_price FROM signals WHERE id = ?', (signal_id,))
+            cursor.execute('SELECT entry_price, signal_type FROM signals WHERE id = ?', (signal_id,))
             row = cursor.fetchone()
             if row:
                 entry_price = row['entry_price']
@@ -185,74 +538,284 @@ class SignalDatabase:
                         SET status = 'CLOSED', validated = 1, 
                             validation_result = ?, final_price = ?,
                             profit_loss = ?, closed_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
+                        WHERE id = ? AND status != 'CLOSED'
                     ''', (status, current_price, price_change, signal_id))
+                    
+                    # فقط اولین بسته شدن در آمار حساب میشود
+                    if cursor.rowcount:
+                        self._bump_stats(conn, self._today(), row['signal_type'],
+                                         **self._closed_counts(status, price_change))
             
             conn.commit()
-            conn.close()
     
-    def get_signal_history(self, days=7, limit=500):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        since = datetime.now() - timedelta(days=days)
-        
-        cursor.execute('''
-            SELECT * FROM signals 
-            WHERE created_at >= ?
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (since, limit))
-        
-        rows = cursor.fetchall()
-        conn.close()
+    @DB_WRITE_SECONDS.time(op='save_order_block_zone')
+    def save_order_block_zone(self, zone):
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT OR IGNORE INTO order_block_zones 
+                (symbol, direction, top, bottom, strength, formed_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                zone['symbol'],
+                zone['direction'],
+                zone['top'],
+                zone['bottom'],
+                zone.get('strength', 50),
+                zone['formed_at'],
+                zone['expires_at']
+            ))
+            
+            zone_id = cursor.lastrowid if cursor.rowcount else None
+            conn.commit()
+            return zone_id
+    
+    @DB_WRITE_SECONDS.time(op='update_order_block_zone')
+    def update_order_block_zone(self, zone_id, status, retests=0, last_retest_at=None):
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE order_block_zones 
+                SET status = ?, retests = ?, last_retest_at = ?
+                WHERE id = ?
+            ''', (status, retests, last_retest_at, zone_id))
+            
+            conn.commit()
+    
+    @DB_WRITE_SECONDS.time(op='expire_order_block_zones')
+    def expire_order_block_zones(self, zone_ids):
+        """بستن یکجای ناحیهها (مثلا بعد از تغییر صرافی)"""
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                UPDATE order_block_zones
+                SET status = 'EXPIRED'
+                WHERE id = ? AND status = 'ACTIVE'
+            ''', [(zone_id,) for zone_id in zone_ids])
+            
+            conn.commit()
+    
+    def get_active_order_block_zones(self):
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM order_block_zones 
+                WHERE status = 'ACTIVE' AND expires_at > ?
+                ORDER BY formed_at
+            ''', (datetime.utcnow().isoformat(),))
+            
+            rows = cursor.fetchall()
         return [dict(row) for row in rows]
     
-    def get_pump_dump_history(self, hours=24):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def set_runtime_value(self, key, value):
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO runtime_config (key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', (key, value, datetime.utcnow().isoformat()))
+            
+            conn.commit()
+    
+    def get_runtime_value(self, key, default=None):
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT value FROM runtime_config WHERE key = ?', (key,))
+            row = cursor.fetchone()
+        return row['value'] if row else default
+    
+    @DB_WRITE_SECONDS.time(op='save_perf_trace')
+    def save_perf_trace(self, trace):
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO perf_traces 
+                (kind, started_at, ended_at, duration_ms, exchange, items, 
+                 bars_fetched, signals_produced, rows_written, errors, detail)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                trace['kind'],
+                trace['started_at'],
+                trace['ended_at'],
+                trace.get('duration_ms'),
+                trace.get('exchange'),
+                trace.get('items', 0),
+                trace.get('bars_fetched', 0),
+                trace.get('signals_produced', 0),
+                trace.get('rows_written', 0),
+                trace.get('errors', 0),
+                json.dumps(trace.get('detail', {}), separators=(',', ':'), default=str)
+            ))
+            
+            trace_id = cursor.lastrowid
+            conn.commit()
+            return trace_id
+    
+    def get_perf_traces(self, kind=None, hours=24, limit=50, symbol=None, min_duration_ms=None):
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            query = 'SELECT * FROM perf_traces WHERE started_at >= ?'
+            params = [(datetime.utcnow() - timedelta(hours=hours)).isoformat()]
+            if kind:
+                query += ' AND kind = ?'
+                params.append(kind)
+            if min_duration_ms is not None:
+                query += ' AND duration_ms >= ?'
+                params.append(min_duration_ms)
+            if symbol:
+                query += ' AND detail LIKE ?'
+                params.append(f'%"{symbol}"%')
+            query += ' ORDER BY started_at DESC LIMIT ?'
+            params.append(limit)
+            
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
         
-        since = datetime.now() - timedelta(hours=hours)
+        traces = []
+        for row in rows:
+            trace = dict(row)
+            trace['detail'] = json.loads(trace['detail']) if trace['detail'] else {}
+            traces.append(trace)
+        return traces
+    
+    @staticmethod
+    def _db_time(value):
+        """فرمت CURRENT_TIMESTAMP (UTC) برای مقایسه با ستونهای زمان"""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', ''))
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    
+    def query_signals(self, symbol=None, signal_type=None, direction=None, min_strength=None,
+                      since=None, until=None, status=None, limit=100, cursor=None):
+        """جستجوی سیگنالها با فیلتر و صفحهبندی keyset
+        cursor: مقدار next_cursor صفحه قبل ("created_at|id")"""
+        query = 'SELECT * FROM signals WHERE 1 = 1'
+        params = []
+        if symbol:
+            query += ' AND symbol = ?'
+            params.append(symbol)
+        if signal_type:
+            query += ' AND signal_type = ?'
+            params.append(signal_type)
+        if direction:
+            query += ' AND direction = ?'
+            params.append(direction)
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        if min_strength is not None:
+            query += ' AND strength >= ?'
+            params.append(min_strength)
+        if since is not None:
+            query += ' AND created_at >= ?'
+            params.append(self._db_time(since))
+        if until is not None:
+            query += ' AND created_at < ?'
+            params.append(self._db_time(until))
+        if cursor:
+            created_at, last_id = cursor.rsplit('|', 1)
+            query += ' AND (created_at < ? OR (created_at = ? AND id < ?))'
+            params.extend([created_at, created_at, int(last_id)])
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit)
         
-        cursor.execute('''
-            SELECT * FROM pump_dump_alerts 
-            WHERE detected_at >= ?
-            ORDER BY detected_at DESC
-        ''', (since,))
+        with self.pool.read() as conn:
+            rows = conn.execute(query, params).fetchall()
         
-        rows = cursor.fetchall()
-        conn.close()
+        signals = [dict(row) for row in rows]
+        next_cursor = None
+        if len(signals) == limit:
+            last = signals[-1]
+            next_cursor = f"{last['created_at']}|{last['id']}"
+        return {'signals': signals, 'next_cursor': next_cursor}
+    
+    def get_signal_history(self, days=7, limit=500):
+        since = datetime.utcnow() - timedelta(days=days)
+        return self.query_signals(since=since, limit=limit)['signals']
+    
+    def get_pump_dump_history(self, hours=24, until=None):
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            since = self._db_time(datetime.utcnow() - timedelta(hours=hours))
+            until = self._db_time(until) if until is not None else '9999-12-31 23:59:59'
+            
+            cursor.execute('''
+                SELECT * FROM pump_dump_alerts 
+                WHERE detected_at >= ? AND detected_at < ?
+                ORDER BY detected_at DESC, id DESC
+            ''', (since, until))
+            
+            rows = cursor.fetchall()
         return [dict(row) for row in rows]
     
-    def get_statistics(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # آمار کلی
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN validation_result = 'SUCCESS' THEN 1 ELSE 0 END) as wins,
-                SUM(CASE WHEN validation_result = 'FAILED' THEN 1 ELSE 0 END) as losses,
-                AVG(CASE WHEN validated = 1 THEN profit_loss ELSE NULL END) as avg_profit
-            FROM signals
-            WHERE validated = 1
-        ''')
-        
-        stats = dict(cursor.fetchone())
-        
-        # آمار امروز
-        today = datetime.now().date()
-        cursor.execute('''
-            SELECT COUNT(*) as today_signals
-            FROM signals
-            WHERE DATE(created_at) = ?
-        ''', (today,))
-        
-        stats['today_signals'] = cursor.fetchone()['today_signals']
+    def get_signal_validations(self, signal_id):
+        with self.pool.read() as conn:
+            rows = conn.execute('''
+                SELECT * FROM signal_validations
+                WHERE signal_id = ?
+                ORDER BY check_time, id
+            ''', (signal_id,)).fetchall()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def _today():
+        return datetime.utcnow().strftime('%Y-%m-%d')
+    
+    def get_statistics(self, days=0):
+        """آمار از جدولهای تجمعی (چند ردیف، مستقل از حجم تاریخچه)"""
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM signal_type_stats WHERE signal_type = '*'")
+            overall = cursor.fetchone()
+            
+            cursor.execute('SELECT total_signals FROM signal_stats WHERE date = ?', (self._today(),))
+            today = cursor.fetchone()
+            
+            cursor.execute('''
+                SELECT * FROM signal_type_stats 
+                WHERE signal_type != '*' 
+                ORDER BY total_signals DESC
+            ''')
+            by_type = [dict(row) for row in cursor.fetchall()]
+            
+            daily = []
+            if days:
+                cursor.execute('SELECT * FROM signal_stats ORDER BY date DESC LIMIT ?', (days,))
+                daily = [dict(row) for row in cursor.fetchall()]
         
-        conn.close()
-        return stats
+        closed = overall['closed_signals'] if overall else 0
+        return {
+            'total': closed,
+            'wins': overall['successful_signals'] if overall else 0,
+            'losses': overall['failed_signals'] if overall else 0,
+            'stopped': overall['stopped_signals'] if overall else 0,
+            'avg_profit': overall['total_profit'] / closed if closed else None,
+            'win_rate': overall['win_rate'] if overall else 0,
+            'all_signals': overall['total_signals'] if overall else 0,
+            'today_signals': today['total_signals'] if today else 0,
+            'by_type': by_type,
+            'daily': daily
+        }
 
 # نمونه گلوبال
 signal_db = SignalDatabase()
+
+# رابط async (سرور یا fetcher مبتنی بر asyncio)
+async_signal_db = AsyncStorage(
+    signal_db, 'signals',
+    reads=('get_active_signals', 'query_signals', 'get_signal_history', 'get_pump_dump_history',
+           'get_signal_validations', 'get_statistics', 'get_runtime_value', 'get_perf_traces', 'get_active_order_block_zones'),
+    writes=('save_signal', 'save_pump_dump', 'save_signals', 'save_pump_dumps', 'update_signal_validation',
+            'save_order_block_zone', 'update_order_block_zone', 'expire_order_block_zones', 'set_runtime_value',
+            'save_perf_trace', 'flush_writes')
+)
@@ -1,9 +1,16 @@
 """دیتابیس پیشرفته با پشتیبانی از سیگنالهای جدید"""
 
 from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import func, case, and_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
+import threading
+import time
+
+from async_storage import AsyncStorage
+from write_behind import WriteBehindQueue
 
 Base = declarative_base()
 
@@ -23,6 +30,17 @@ class CryptoPrice(Base):
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     timeframe = Column(String(10), default='1m')
 
+class LatestPrice(Base):
+    """آخرین قیمت هر نماد؛ همراه هر درج crypto_prices به‌روز میشود"""
+    __tablename__ = 'latest_prices'
+    symbol = Column(String(20), primary_key=True)
+    price = Column(Float)
+    price_change_percent = Column(Float)
+    volume = Column(Float)
+    quote_volume = Column(Float)
+    timestamp = Column(DateTime)
+    timeframe = Column(String(10))
+
 class SignalRecord(Base):
     __tablename__ = 'signal_records'
     id = Column(Integer, primary_key=True)
@@ -129,62 +147,139 @@ class Database:
         self.engine = create_engine(db_url, echo=False)
         Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
+        self.price_writer = WriteBehindQueue('crypto_prices', self.save_prices, max_rows=1000)
+        self.signal_writer = WriteBehindQueue('signal_records', self.save_signals)
+        self.pump_dump_writer = WriteBehindQueue('pump_dump_records', self.save_pump_dumps)
+        self.stats_cache = {}
+        self.stats_ttl = 30
+        self.stats_lock = threading.Lock()
+        self._backfill_latest_prices()
     
     def get_session(self):
         return self.Session()
     
     def save_price(self, data):
-        session = self.Session()
         try:
-            price = CryptoPrice(**data)
-            session.add(price)
-            session.commit()
-            return price.id
+            with self.engine.begin() as conn:
+                data = self._price_values(data)
+                result = conn.execute(CryptoPrice.__table__.insert().values(**data))
+                self._upsert_latest(conn, [data])
+                return result.inserted_primary_key[0]
         except Exception as e:
-            session.rollback()
-        finally:
-            session.close()
+            print(f"خطا در ذخیره قیمت: {e}")
+    
+    # ---------- قیمتها ----------
+    
+    LATEST_COLUMNS = ('price', 'price_change_percent', 'volume', 'quote_volume', 'timestamp', 'timeframe')
+    
+    @staticmethod
+    def _price_values(data):
+        """زمان یکسان برای tick و جدول آخرین قیمت"""
+        data = dict(data)
+        if data.get('timestamp') is None:
+            data['timestamp'] = datetime.utcnow()
+        data.setdefault('timeframe', '1m')
+        return data
+    
+    def _upsert_latest(self, conn, rows):
+        """به‌روزرسانی latest_prices در همان تراکنش درج"""
+        latest = {}
+        for row in rows:
+            current = latest.get(row['symbol'])
+            if current is None or row['timestamp'] >= current['timestamp']:
+                latest[row['symbol']] = row
+        if not latest:
+            return
+        values = [
+            {'symbol': symbol, **{column: row.get(column) for column in self.LATEST_COLUMNS}}
+            for symbol, row in latest.items()
+        ]
+        
+        table = LatestPrice.__table__
+        dialect = {'sqlite': sqlite, 'postgresql': postgresql}.get(self.engine.dialect.name)
+        if dialect is None:
+            # دیتابیس بدون ON CONFLICT
+            conn.execute(table.delete().where(table.c.symbol.in_(list(latest))))
+            conn.execute(table.insert(), values)
+            return
+        stmt = dialect.insert(table)
+        # tick قدیمیتر (مثلا از صف عقب افتاده) آخرین قیمت را برنمیگرداند
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.symbol],
+            set_={column: stmt.excluded[column] for column in self.LATEST_COLUMNS},
+            where=stmt.excluded.timestamp >= table.c.timestamp
+        ), values)
+    
+    def _backfill_latest_prices(self):
+        """ساخت اولیه latest_prices از crypto_prices موجود (فقط یکبار)"""
+        with self.engine.begin() as conn:
+            if conn.execute(LatestPrice.__table__.select().limit(1)).first() is not None:
+                return
+            latest_ids = conn.execute(
+                CryptoPrice.__table__.select().with_only_columns(func.max(CryptoPrice.id)).group_by(CryptoPrice.symbol)
+            ).scalars().all()
+            if latest_ids:
+                rows = conn.execute(
+                    CryptoPrice.__table__.select().where(CryptoPrice.id.in_(latest_ids))
+                ).mappings().all()
+                self._upsert_latest(conn, [self._price_values(row) for row in rows])
+    
+    def _signal_values(self, signal_data):
+        """ستونهای SignalRecord از دیکشنری سیگنال"""
+        entry_price = signal_data.get('price', 0)
+        target_pct = signal_data.get('target_percent', 2.0)
+        stop_pct = signal_data.get('stop_percent', 1.0)
+        
+        if signal_data.get('signal_type') == 'BUY' or signal_data.get('signal') == 'BUY':
+            target_price = entry_price * (1 + target_pct / 100)
+            stop_price = entry_price * (1 - stop_pct / 100)
+            sig_type = 'BUY'
+        else:
+            target_price = entry_price * (1 - target_pct / 100)
+            stop_price = entry_price * (1 + stop_pct / 100)
+            sig_type = 'SELL'
+        
+        sig_source = signal_data.get('signal_source', signal_data.get('type', 'MIXED'))
+        
+        return dict(
+            symbol=signal_data.get('symbol'),
+            signal_type=sig_type,
+            signal_source=sig_source,
+            signal_category=self._get_category(sig_source),
+            strength=signal_data.get('strength', 50),
+            reason=signal_data.get('reason', ''),
+            entry_price=entry_price,
+            target_percent=target_pct,
+            stop_percent=stop_pct,
+            target_price=target_price,
+            stop_price=stop_price,
+            expires_at=datetime.utcnow() + timedelta(hours=1),
+            is_smart_money='SMART_MONEY' in sig_source,
+            is_order_block='ORDER_BLOCK' in sig_source,
+            is_liquidity_hunt='LIQUIDITY' in sig_source,
+            is_divergence='DIVERGENCE' in sig_source,
+            is_whale='WHALE' in sig_source,
+            is_pump_dump='PUMP' in sig_source or 'DUMP' in sig_source,
+            rsi_value=signal_data.get('rsi'),
+            volume_zscore=signal_data.get('volume_zscore')
+        )
+    
+    @staticmethod
+    def _pump_dump_values(alert_data):
+        return dict(
+            symbol=alert_data.get('symbol'),
+            alert_type=alert_data.get('alert_type'),
+            price_at_alert=alert_data.get('price'),
+            price_change_percent=alert_data.get('price_change'),
+            volume_change_percent=alert_data.get('volume_change'),
+            momentum=alert_data.get('momentum'),
+            time_period=alert_data.get('time_period', '15m')
+        )
     
     def save_signal(self, signal_data):
         session = self.Session()
         try:
-            entry_price = signal_data.get('price', 0)
-            target_pct = signal_data.get('target_percent', 2.0)
-            stop_pct = signal_data.get('stop_percent', 1.0)
-            
-            if signal_data.get('signal_type') == 'BUY' or signal_data.get('signal') == 'BUY':
-                target_price = entry_price * (1 + target_pct / 100)
-                stop_price = entry_price * (1 - stop_pct / 100)
-                sig_type = 'BUY'
-            else:
-                target_price = entry_price * (1 - target_pct / 100)
-                stop_price = entry_price * (1 + stop_pct / 100)
-                sig_type = 'SELL'
-            
-            sig_source = signal_data.get('signal_source', signal_data.get('type', 'MIXED'))
-            
-            record = SignalRecord(
-                symbol=signal_data.get('symbol'),
-                signal_type=sig_type,
-                signal_source=sig_source,
-                signal_category=self._get_category(sig_source),
-                strength=signal_data.get('strength', 50),
-                reason=signal_data.get('reason', ''),
-                entry_price=entry_price,
-                target_percent=target_pct,
-                stop_percent=stop_pct,
-                target_price=target_price,
-                stop_price=stop_price,
-                expires_at=datetime.utcnow() + timedelta(hours=1),
-                is_smart_money='SMART_MONEY' in sig_source,
-                is_order_block='ORDER_BLOCK' in sig_source,
-                is_liquidity_hunt='LIQUIDITY' in sig_source,
-                is_divergence='DIVERGENCE' in sig_source,
-                is_whale='WHALE' in sig_source,
-                is_pump_dump='PUMP' in sig_source or 'DUMP' in sig_source,
-                rsi_value=signal_data.get('rsi'),
-                volume_zscore=signal_data.get('volume_zscore')
-            )
+            record = SignalRecord(**self._signal_values(signal_data))
             
             session.add(record)
             session.commit()
@@ -221,15 +316,7 @@ class Database:
     def save_pump_dump(self, alert_data):
         session = self.Session()
         try:
-            record = PumpDumpRecord(
-                symbol=alert_data.get('symbol'),
-                alert_type=alert_data.get('alert_type'),
-                price_at_alert=alert_data.get('price'),
-                price_change_percent=alert_data.get('price_change'),
-                volume_change_percent=alert_data.get('volume_change'),
-                momentum=alert_data.get('momentum'),
-                time_period=alert_data.get('time_period', '15m')
-            )
+            record = PumpDumpRecord(**self._pump_dump_values(alert_data))
             session.add(record)
             session.commit()
             return record.id
@@ -238,6 +325,72 @@ class Database:
         finally:
             session.close()
     
+    # ---------- درج دستهای و نوشتن با تاخیر ----------
+    
+    def _insert_many(self, table, rows):
+        """executemany در یک تراکنش"""
+        with self.engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+    
+    def save_prices(self, rows):
+        """درج دستهای tickها و آخرین قیمتها در یک تراکنش"""
+        rows = [self._price_values(row) for row in rows]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(CryptoPrice.__table__.insert(), rows)
+            self._upsert_latest(conn, rows)
+    
+    def save_ticker_snapshot(self, tickers, timeframe='1m'):
+        """ذخیره کل خروجی fetch_tickers در یک تراکنش"""
+        now = datetime.utcnow()
+        rows = []
+        for symbol, ticker in tickers.items():
+            if ticker.get('last') is None:
+                continue
+            rows.append({
+                'symbol': symbol,
+                'price': ticker.get('last'),
+                'open_price': ticker.get('open'),
+                'high_price': ticker.get('high'),
+                'low_price': ticker.get('low'),
+                'close_price': ticker.get('close'),
+                'volume': ticker.get('baseVolume'),
+                'quote_volume': ticker.get('quoteVolume'),
+                'price_change': ticker.get('change'),
+                'price_change_percent': ticker.get('percentage'),
+                'timestamp': now,
+                'timeframe': timeframe
+            })
+        self.save_prices(rows)
+        return len(rows)
+    
+    def save_signals(self, signals):
+        self._insert_many(SignalRecord.__table__, [self._signal_values(s) for s in signals])
+    
+    def save_pump_dumps(self, alerts):
+        self._insert_many(PumpDumpRecord.__table__, [self._pump_dump_values(a) for a in alerts])
+    
+    def enqueue_price(self, data):
+        """ذخیره در پسزمینه؛ فراخواننده منتظر دیسک نمیماند"""
+        self.price_writer.put(data)
+    
+    def enqueue_signal(self, signal_data):
+        self.signal_writer.put(signal_data)
+    
+    def enqueue_pump_dump(self, alert_data):
+        self.pump_dump_writer.put(alert_data)
+    
+    def flush_writes(self):
+        """انتظار تا ذخیره همه رکوردهای صف"""
+        for writer in (self.price_writer, self.signal_writer, self.pump_dump_writer):
+            writer.flush()
+    
+    def close(self):
+        for writer in (self.price_writer, self.signal_writer, self.pump_dump_writer):
+            writer.stop()
+        self.engine.dispose()
+    
     def _get_category(self, source):
         if any(x in source for x in ['SMART_MONEY', 'ORDER_BLOCK', 'LIQUIDITY', 'DIVERGENCE', 'WHALE']):
             return 'ADVANCED'
@@ -300,69 +453,99 @@ class Database:
         finally:
             session.close()
     
+    ADVANCED_FLAGS = [
+        ('is_smart_money', 'smart_money'),
+        ('is_order_block', 'order_block'),
+        ('is_liquidity_hunt', 'liquidity'),
+        ('is_divergence', 'divergence'),
+        ('is_whale', 'whale')
+    ]
+    
+    def _window_columns(self, hours, cutoff):
+        """ستونهای شمارش شرطی یک پنجره زمانی"""
+        in_window = SignalRecord.created_at >= cutoff
+        success = SignalRecord.result == 'success'
+        
+        def count(*conditions):
+            return func.sum(case((and_(in_window, *conditions), 1), else_=0))
+        
+        columns = [
+            count(),
+            count(success),
+            count(SignalRecord.result == 'failure'),
+            count(SignalRecord.status == 'pending')
+        ]
+        for field, _ in self.ADVANCED_FLAGS:
+            flag = getattr(SignalRecord, field) == True
+            columns.append(count(flag))
+            columns.append(count(flag, success))
+        columns.append(func.avg(case((and_(in_window, success), SignalRecord.profit_percent))))
+        return columns
+    
+    def _window_stats(self, hours, values):
+        total, successful, failed, pending = (int(v or 0) for v in values[:4])
+        advanced_stats = {}
+        for n, (_, name) in enumerate(self.ADVANCED_FLAGS):
+            field_total, field_success = (int(v or 0) for v in values[4 + n * 2:6 + n * 2])
+            advanced_stats[name] = {
+                'total': field_total,
+                'success': field_success,
+                'rate': round((field_success / field_total * 100) if field_total > 0 else 0, 2)
+            }
+        avg_profit = values[-1] or 0
+        
+        return {
+            'period_hours': hours,
+            'total_signals': total,
+            'successful': successful,
+            'failed': failed,
+            'pending': pending,
+            'success_rate': round((successful / total * 100) if total > 0 else 0, 2),
+            'failure_rate': round((failed / total * 100) if total > 0 else 0, 2),
+            'advanced': advanced_stats,
+            'avg_profit': round(avg_profit, 2),
+            'calculated_at': datetime.utcnow().isoformat()
+        }
+    
     def get_accuracy_stats(self, hours=24):
-        session = self.Session()
-        try:
-            from sqlalchemy import func
-            cutoff = datetime.utcnow() - timedelta(hours=hours)
-            
-            total = session.query(SignalRecord).filter(SignalRecord.created_at >= cutoff).count()
-            successful = session.query(SignalRecord).filter(
-                SignalRecord.created_at >= cutoff,
-                SignalRecord.result == 'success'
-            ).count()
-            failed = session.query(SignalRecord).filter(
-                SignalRecord.created_at >= cutoff,
-                SignalRecord.result == 'failure'
-            ).count()
-            pending = session.query(SignalRecord).filter(
-                SignalRecord.created_at >= cutoff,
-                SignalRecord.status == 'pending'
-            ).count()
-            
-            # آمار پیشرفته
-            advanced_stats = {}
-            for field, name in [
-                ('is_smart_money', 'smart_money'),
-                ('is_order_block', 'order_block'),
-                ('is_liquidity_hunt', 'liquidity'),
-                ('is_divergence', 'divergence'),
-                ('is_whale', 'whale')
-            ]:
-                field_total = session.query(SignalRecord).filter(
-                    SignalRecord.created_at >= cutoff,
-                    getattr(SignalRecord, field) == True
-                ).count()
-                field_success = session.query(SignalRecord).filter(
-                    SignalRecord.created_at >= cutoff,
-                    getattr(SignalRecord, field) == True,
-                    SignalRecord.result == 'success'
-                ).count()
-                advanced_stats[name] = {
-                    'total': field_total,
-                    'success': field_success,
-                    'rate': round((field_success / field_total * 100) if field_total > 0 else 0, 2)
-                }
+        """آمار دقت؛ hours یک عدد یا لیست پنجرهها (مثلا [1, 24, 168]) - همه در یک query"""
+        windows = sorted(set(hours)) if isinstance(hours, (list, tuple)) else [hours]
+        if not windows:
+            return {}
+        key = tuple(windows)
+        
+        with self.stats_lock:
+            cached = self.stats_cache.get(key)
+            if cached is not None and time.time() - cached[0] < self.stats_ttl:
+                results = cached[1]
+            else:
+                results = None
+        
+        if results is None:
+            now = datetime.utcnow()
+            columns = []
+            spans = []
+            for window in windows:
+                window_columns = self._window_columns(window, now - timedelta(hours=window))
+                spans.append((window, len(columns), len(columns) + len(window_columns)))
+                columns.extend(window_columns)
             
-            avg_profit = session.query(func.avg(SignalRecord.profit_percent)).filter(
-                SignalRecord.created_at >= cutoff,
-                SignalRecord.result == 'success'
-            ).scalar() or 0
+            session = self.Session()
+            try:
+                # فقط بازه بزرگترین پنجره از ایندکس created_at خوانده میشود
+                row = session.query(*columns).filter(
+                    SignalRecord.created_at >= now - timedelta(hours=windows[-1])
+                ).one()
+            finally:
+                session.close()
             
-            return {
-                'period_hours': hours,
-                'total_signals': total,
-                'successful': successful,
-                'failed': failed,
-                'pending': pending,
-                'success_rate': round((successful / total * 100) if total > 0 else 0, 2),
-                'failure_rate': round((failed / total * 100) if total > 0 else 0, 2),
-                'advanced': advanced_stats,
-                'avg_profit': round(avg_profit, 2),
-                'calculated_at': datetime.utcnow().isoformat()
-            }
-        finally:
-            session.close()
+            results = {window: self._window_stats(window, row[start:end]) for window, start, end in spans}
+            with self.stats_lock:
+                self.stats_cache[key] = (time.time(), results)
+        
+        if isinstance(hours, (list, tuple)):
+            return results
+        return results[hours]
     
     def get_signal_history(self, limit=100, symbol=None, category=None):
         session = self.Session()
@@ -420,17 +603,7 @@ class Database:
     def get_latest_prices(self, limit=250):
         session = self.Session()
         try:
-            from sqlalchemy import func
-            subquery = session.query(
-                CryptoPrice.symbol,
-                func.max(CryptoPrice.id).label('max_id')
-            ).group_by(CryptoPrice.symbol).subquery()
-            
-            prices = session.query(CryptoPrice).join(
-                subquery,
-                (CryptoPrice.symbol == subquery.c.symbol) & 
-                (CryptoPrice.id == subquery.c.max_id)
-            ).limit(limit).all()
+            prices = session.query(LatestPrice).limit(limit).all()
             
             return [{
                 'symbol': p.symbol,
@@ -443,3 +616,13 @@ class Database:
             session.close()
 
 db = Database()
+
+# رابط async
+async_db = AsyncStorage(
+    db, 'crypto_futures',
+    reads=('get_pending_signals', 'get_pending_pump_dumps', 'get_accuracy_stats', 'get_signal_history',
+           'get_pump_dump_history', 'get_latest_prices'),
+    writes=('save_price', 'save_prices', 'save_ticker_snapshot', 'save_signal', 'save_signals',
+            'save_advanced_signal', 'save_pump_dump', 'save_pump_dumps', 'update_signal_result',
+            'update_pump_dump_result', 'flush_writes')
+)
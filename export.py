@@ -0,0 +1,263 @@
+"""
+خروجی جریانی سیگنالها همراه خلاصه اعتبارسنجی (NDJSON یا CSV، با gzip اختیاری)
+صفحه به صفحه با keyset خوانده میشود؛ حافظه مستقل از طول بازه است
+"""
+from datetime import datetime
+import csv
+import io
+import json
+import zlib
+
+from database import signal_db
+from retention import retention
+from metrics import registry
+
+EXPORT_ROWS = registry.counter('export_rows_total', 'Signal rows written by exports', ['format', 'source'])
+
+SIGNAL_COLUMNS = (
+    'id', 'symbol', 'signal_type', 'direction', 'entry_price', 'target_price', 'stop_loss', 'strength',
+    'reason', 'indicator_data', 'created_at', 'status', 'validated', 'validation_result', 'final_price',
+    'profit_loss', 'closed_at'
+)
+VALIDATION_COLUMNS = (
+    'checks', 'first_check', 'last_check', 'first_price', 'last_price', 'min_price', 'max_price',
+    'min_change_pct', 'max_change_pct', 'final_status', 'seconds_to_close'
+)
+COLUMNS = SIGNAL_COLUMNS + VALIDATION_COLUMNS
+
+
+def _summarize_checks(checks, signal):
+    """خلاصه ردیفهای اعتبارسنجی (همان ستونهای validation_summaries)"""
+    if not checks:
+        return {}
+    checks = sorted(checks, key=lambda v: (str(v['check_time']), v['id']))
+    prices = [v['current_price'] for v in checks if v['current_price'] is not None]
+    changes = [v['price_change_pct'] for v in checks if v['price_change_pct'] is not None]
+    return {
+        'checks': len(checks),
+        'first_check': checks[0]['check_time'],
+        'last_check': checks[-1]['check_time'],
+        'first_price': checks[0]['current_price'],
+        'last_price': checks[-1]['current_price'],
+        'min_price': min(prices, default=None),
+        'max_price': max(prices, default=None),
+        'min_change_pct': min(changes, default=None),
+        'max_change_pct': max(changes, default=None),
+        'final_status': signal.get('validation_result'),
+        'seconds_to_close': _seconds_between(signal.get('created_at'), signal.get('closed_at'))
+    }
+
+
+def _seconds_between(start, end):
+    if not start or not end:
+        return None
+    return (datetime.fromisoformat(str(end)) - datetime.fromisoformat(str(start))).total_seconds()
+
+
+class SignalExporter:
+    """سیگنالها + اعتبارسنجی از دیتابیس (و در صورت نیاز بایگانی) به صورت جریانی"""
+
+    FORMATS = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv'
+    }
+
+    def __init__(self, db, retention=None, batch_size=1000):
+        self.db = db
+        self.retention = retention
+        self.batch_size = batch_size
+
+    # ---------- خواندن ----------
+
+    def _validation_columns(self, conn, signals):
+        """خلاصه اعتبارسنجی یک صفحه سیگنال با دو query روی ایندکس signal_id"""
+        ids = [s['id'] for s in signals]
+        marks = ','.join('?' * len(ids))
+        summaries = {
+            row['signal_id']: dict(row) for row in conn.execute(
+                f'SELECT * FROM validation_summaries WHERE signal_id IN ({marks})', ids)
+        }
+        live = {
+            row['signal_id']: dict(row) for row in conn.execute(f'''
+                SELECT v.signal_id, COUNT(*) AS checks,
+                    MIN(v.check_time) AS first_check, MAX(v.check_time) AS last_check,
+                    (SELECT current_price FROM signal_validations f
+                     WHERE f.signal_id = v.signal_id ORDER BY f.check_time, f.id LIMIT 1) AS first_price,
+                    (SELECT current_price FROM signal_validations l
+                     WHERE l.signal_id = v.signal_id ORDER BY l.check_time DESC, l.id DESC LIMIT 1) AS last_price,
+                    MIN(v.current_price) AS min_price, MAX(v.current_price) AS max_price,
+                    MIN(v.price_change_pct) AS min_change_pct, MAX(v.price_change_pct) AS max_change_pct
+                FROM signal_validations v
+                WHERE v.signal_id IN ({marks})
+                GROUP BY v.signal_id
+            ''', ids)
+        }
+        for signal in signals:
+            summary = summaries.get(signal['id'])
+            if summary is None:
+                summary = live.get(signal['id'], {})
+                if summary:
+                    summary['final_status'] = signal['validation_result']
+                    summary['seconds_to_close'] = signal.pop('seconds_to_close')
+            signal.pop('seconds_to_close', None)
+            for column in VALIDATION_COLUMNS:
+                signal[column] = summary.get(column)
+        return signals
+
+    def _db_rows(self, since=None, until=None, symbol=None, signal_type=None):
+        """صفحههای keyset از signals به ترتیب (created_at, id)"""
+        query = '''
+            SELECT *, (julianday(closed_at) - julianday(created_at)) * 86400 AS seconds_to_close
+            FROM signals WHERE 1 = 1
+        '''
+        params = []
+        if symbol:
+            query += ' AND symbol = ?'
+            params.append(symbol)
+        if signal_type:
+            query += ' AND signal_type = ?'
+            params.append(signal_type)
+        if since is not None:
+            query += ' AND created_at >= ?'
+            params.append(self.db._db_time(since))
+        if until is not None:
+            query += ' AND created_at < ?'
+            params.append(self.db._db_time(until))
+
+        last = None
+        while True:
+            page_query, page_params = query, list(params)
+            if last:
+                page_query += ' AND (created_at > ? OR (created_at = ? AND id > ?))'
+                page_params.extend([last[0], last[0], last[1]])
+            page_query += ' ORDER BY created_at, id LIMIT ?'
+            page_params.append(self.batch_size)
+
+            # هر صفحه یک query کوتاه؛ اتصال بین صفحهها آزاد است و نوشتنها منتظر نمیمانند
+            with self.db.pool.read() as conn:
+                signals = [dict(row) for row in conn.execute(page_query, page_params)]
+                if not signals:
+                    return
+                self._validation_columns(conn, signals)
+            last = (signals[-1]['created_at'], signals[-1]['id'])
+            yield signals
+            if len(signals) < self.batch_size:
+                return
+
+    def _archive_rows(self, since=None, until=None, symbol=None, signal_type=None):
+        """سیگنالهای بایگانی شده (ردیفی که هنوز در دیتابیس هست از دیتابیس خوانده میشود)"""
+        if self.retention is None:
+            return
+        since = self.db._db_time(since) if since is not None else None
+        until = self.db._db_time(until) if until is not None else None
+
+        def flush(batch):
+            ids = [row['id'] for row in batch]
+            with self.db.pool.read() as conn:
+                present = {row[0] for row in conn.execute(
+                    f"SELECT id FROM signals WHERE id IN ({','.join('?' * len(ids))})", ids)}
+            out = []
+            for row in batch:
+                if row['id'] in present:
+                    continue
+                summary = row.get('validation') or _summarize_checks(row.get('checks'), row)
+                out.append({**{c: row.get(c) for c in SIGNAL_COLUMNS},
+                            **{c: summary.get(c) for c in VALIDATION_COLUMNS}})
+            return out
+
+        batch = []
+        for row in self.retention.iter_archive('signals', since, until):
+            if symbol and row.get('symbol') != symbol or signal_type and row.get('signal_type') != signal_type:
+                continue
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield flush(batch)
+                batch = []
+        if batch:
+            yield flush(batch)
+
+    def batches(self, since=None, until=None, symbol=None, signal_type=None, include_archive=False):
+        """دستههای ردیف؛ اول بایگانی (قدیمیتر)، بعد دیتابیس"""
+        if include_archive:
+            for rows in self._archive_rows(since, until, symbol, signal_type):
+                if rows:
+                    yield 'archive', rows
+        for rows in self._db_rows(since, until, symbol, signal_type):
+            yield 'db', rows
+
+    # ---------- نوشتن ----------
+
+    def _encode(self, fmt, batches):
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(COLUMNS)
+            for source, rows in batches:
+                writer.writerows([row[c] for c in COLUMNS] for row in rows)
+                EXPORT_ROWS.inc(len(rows), format=fmt, source=source)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str).encode
+            for source, rows in batches:
+                EXPORT_ROWS.inc(len(rows), format=fmt, source=source)
+                yield ''.join(encode(row) + '\n' for row in rows).encode()
+
+    @staticmethod
+    def _gzip(chunks):
+        """فشردهسازی جریانی (فرمت gzip)"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def export(self, fmt='ndjson', since=None, until=None, symbol=None, signal_type=None,
+               include_archive=False, compress=False):
+        """تکههای بایت خروجی؛ برای Response جریانی یا نوشتن در فایل"""
+        if fmt not in self.FORMATS:
+            raise ValueError(f'unknown format: {fmt}')
+        # خطای پارامتر قبل از شروع جریان
+        for value in (since, until):
+            if value is not None:
+                self.db._db_time(value)
+        chunks = self._encode(fmt, self.batches(since, until, symbol, signal_type, include_archive))
+        return self._gzip(chunks) if compress else chunks
+
+
+# نمونه گلوبال
+exporter = SignalExporter(signal_db, retention)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description='Export signals with their validations')
+    parser.add_argument('--since')
+    parser.add_argument('--until')
+    parser.add_argument('--symbol')
+    parser.add_argument('--type', dest='signal_type')
+    parser.add_argument('--format', choices=sorted(SignalExporter.FORMATS), default='ndjson')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--archive', action='store_true', help='include archived signals')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    started = time.time()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in exporter.export(args.format, args.since, args.until, args.symbol, args.signal_type,
+                                     args.archive, args.gzip):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"📤 Exported {written / 1024 / 1024:.1f} MB in {time.time() - started:.1f}s", file=sys.stderr)
@@ -0,0 +1,283 @@
+"""
+لایه داغ: سیگنالها، هشدارها و اعتبارسنجیهای اخیر در حافظه، SQLite لایه سرد
+ردیفهای جدید با دنبال کردن id از دیتابیس خوانده میشوند (اسکنر میتواند پردازه جدا باشد)
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+import threading
+import time
+
+from database import signal_db
+from metrics import registry
+
+QUERIES = registry.counter('hot_tier_queries_total', 'History queries by tier that answered them', ['query', 'tier'])
+HOT_ROWS = registry.gauge('hot_tier_rows', 'Rows held in the in-memory hot tier', ['table'])
+SYNC_SECONDS = registry.histogram('hot_tier_sync_seconds', 'Duration of one hot tier sync from SQLite')
+
+
+def _next_second(ts):
+    return (datetime.strptime(ts, '%Y-%m-%d %H:%M:%S') + timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class HotTable:
+    """بافر محدود مرتب بر اساس (زمان، id) برای یک جدول"""
+
+    def __init__(self, time_column, max_rows, group_by=None):
+        self.time_column = time_column
+        self.max_rows = max_rows
+        self.group_by = group_by    # ایندکس اضافه (مثلا signal_id اعتبارسنجیها)
+        self.keys = []              # (زمان، id) مرتب
+        self.rows = {}              # id -> ردیف
+        self.groups = {}
+        self.start = None           # همه ردیفهای با زمان >= start اینجا هستند
+
+    def add(self, row):
+        row_id = row['id']
+        if row_id in self.rows:
+            self.rows[row_id] = row
+            return
+        key = (row[self.time_column], row_id)
+        if self.start is not None and key[0] < self.start:
+            return
+        if not self.keys or key > self.keys[-1]:
+            self.keys.append(key)
+        else:
+            insort(self.keys, key)
+        self.rows[row_id] = row
+        if self.group_by:
+            self.groups.setdefault(row[self.group_by], []).append(row_id)
+
+    def trim(self, cutoff):
+        """حذف ردیفهای قدیمیتر از cutoff و بیشتر از max_rows"""
+        n = bisect_left(self.keys, (cutoff,))
+        start = max(self.start or cutoff, cutoff)
+        if len(self.keys) - n > self.max_rows:
+            # ردیفهای همان ثانیه با هم حذف میشوند تا پوشش از ثانیه بعد کامل بماند
+            n = len(self.keys) - self.max_rows
+            last = self.keys[n - 1][0]
+            while n < len(self.keys) and self.keys[n][0] == last:
+                n += 1
+            start = _next_second(last)
+        for _, row_id in self.keys[:n]:
+            row = self.rows.pop(row_id)
+            if self.group_by:
+                group = self.groups.get(row[self.group_by])
+                if group is not None:
+                    group.remove(row_id)
+                    if not group:
+                        del self.groups[row[self.group_by]]
+        del self.keys[:n]
+        self.start = start
+
+    def scan(self, since=None, before=None):
+        """ردیفها از جدید به قدیم؛ since <= (زمان، id) < before"""
+        lo = bisect_left(self.keys, (since,)) if since else 0
+        hi = bisect_left(self.keys, before) if before else len(self.keys)
+        for i in range(hi - 1, lo - 1, -1):
+            yield self.rows[self.keys[i][1]]
+
+
+class HotTier:
+    """پاسخ به queryهای بازه اخیر از حافظه و ترکیب با SQLite برای بازههای قدیمیتر"""
+
+    TABLES = ('signals', 'pump_dump_alerts', 'signal_validations')
+
+    def __init__(self, db, hours=24, max_signals=50000, max_alerts=20000, max_validations=200000, interval=1):
+        self.db = db
+        self.hours = hours
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.tables = {
+            'signals': HotTable('created_at', max_signals),
+            'pump_dump_alerts': HotTable('detected_at', max_alerts),
+            'signal_validations': HotTable('check_time', max_validations, group_by='signal_id')
+        }
+        self.last_ids = dict.fromkeys(self.TABLES, 0)
+        self.loaded = False
+        self.running = False
+        self.thread = None
+
+    def _cutoff(self):
+        return self.db._db_time(datetime.utcnow() - timedelta(hours=self.hours))
+
+    # ---------- پر کردن از SQLite ----------
+
+    def load(self):
+        """بارگذاری بازه داغ؛ از این به بعد فقط ردیفهای جدید خوانده میشوند"""
+        cutoff = self._cutoff()
+        with self.db.pool.read() as conn:
+            last_ids = {
+                table: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                for table in self.TABLES
+            }
+            rows = {
+                table: [dict(row) for row in conn.execute(
+                    f'SELECT * FROM {table} WHERE {hot.time_column} >= ? AND id <= ? ORDER BY id',
+                    (cutoff, last_ids[table]))]
+                for table, hot in self.tables.items()
+            }
+        with self.lock:
+            for table, hot in self.tables.items():
+                hot.start = cutoff
+                for row in rows[table]:
+                    hot.add(row)
+                hot.trim(cutoff)
+            self.last_ids = last_ids
+            self.loaded = True
+            self._update_gauges()
+
+    def sync(self):
+        """خواندن ردیفهای جدید (id بزرگتر) و سیگنالهایی که اعتبارسنجی جدید دارند"""
+        with SYNC_SECONDS.time():
+            last_ids = dict(self.last_ids)
+            with self.db.pool.read() as conn:
+                new = {
+                    table: [dict(row) for row in conn.execute(
+                        f'SELECT * FROM {table} WHERE id > ? ORDER BY id', (last_ids[table],))]
+                    for table in self.TABLES
+                }
+                # وضعیت سیگنال با اعتبارسنجی تغییر میکند (بسته شدن)
+                fresh = {row['id'] for row in new['signals']}
+                with self.lock:
+                    known = self.tables['signals'].rows
+                    changed = list({v['signal_id'] for v in new['signal_validations']
+                                    if v['signal_id'] in known or v['signal_id'] in fresh})
+                updated = []
+                for n in range(0, len(changed), 500):
+                    part = changed[n:n + 500]
+                    updated += [dict(row) for row in conn.execute(
+                        f"SELECT * FROM signals WHERE id IN ({','.join('?' * len(part))})", part)]
+
+            cutoff = self._cutoff()
+            with self.lock:
+                for table, rows in new.items():
+                    hot = self.tables[table]
+                    for row in rows:
+                        hot.add(row)
+                    if rows:
+                        self.last_ids[table] = rows[-1]['id']
+                    hot.trim(cutoff)
+                for row in updated:
+                    self.tables['signals'].add(row)
+                self._update_gauges()
+
+    def _update_gauges(self):
+        for table, hot in self.tables.items():
+            HOT_ROWS.set(len(hot.rows), table=table)
+
+    def run_loop(self):
+        while self.running:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Hot tier sync error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if not self.running:
+            self.load()
+            self.running = True
+            self.thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.thread.start()
+            print(f"🔥 Hot tier: {len(self.tables['signals'].rows)} signals, "
+                  f"{len(self.tables['pump_dump_alerts'].rows)} alerts in memory (last {self.hours}h)")
+
+    def stop(self):
+        self.running = False
+
+    # ---------- queryها ----------
+
+    def query_signals(self, symbol=None, signal_type=None, direction=None, min_strength=None,
+                      since=None, until=None, status=None, limit=100, cursor=None):
+        """همان query_signals دیتابیس؛ بخش داغ از حافظه، بقیه از SQLite"""
+        filters = dict(symbol=symbol, signal_type=signal_type, direction=direction,
+                       min_strength=min_strength, status=status)
+        if not self.loaded:
+            QUERIES.inc(query='signals', tier='cold')
+            return self.db.query_signals(since=since, until=until, limit=limit, cursor=cursor, **filters)
+
+        since = self.db._db_time(since) if since is not None else None
+        until = self.db._db_time(until) if until is not None else None
+        before = (until,) if until else None
+        if cursor:
+            created_at, last_id = cursor.rsplit('|', 1)
+            before = min(before, (created_at, int(last_id))) if before else (created_at, int(last_id))
+
+        hot = self.tables['signals']
+        signals = []
+        with self.lock:
+            start = hot.start
+            if before is None or before[0] >= start:
+                for row in hot.scan(max(since or start, start), before):
+                    if symbol and row['symbol'] != symbol \
+                            or signal_type and row['signal_type'] != signal_type \
+                            or direction and row['direction'] != direction \
+                            or status and row['status'] != status \
+                            or min_strength is not None \
+                            and (row['strength'] is None or row['strength'] < min_strength):
+                        continue
+                    signals.append(dict(row))
+                    if len(signals) == limit:
+                        break
+
+        if len(signals) < limit and (since is None or since < start):
+            # باقیمانده از لایه سرد (همه ردیفهای آن قدیمیتر از start هستند)
+            cold_until = min(until, start) if until else start
+            cold = self.db.query_signals(since=since, until=cold_until, limit=limit - len(signals),
+                                         cursor=cursor, **filters)['signals']
+            QUERIES.inc(query='signals', tier='merged' if signals else 'cold')
+            signals += cold
+        else:
+            QUERIES.inc(query='signals', tier='hot')
+
+        next_cursor = None
+        if len(signals) == limit:
+            last = signals[-1]
+            next_cursor = f"{last['created_at']}|{last['id']}"
+        return {'signals': signals, 'next_cursor': next_cursor}
+
+    def get_signal_history(self, days=7, limit=500):
+        since = datetime.utcnow() - timedelta(days=days)
+        return self.query_signals(since=since, limit=limit)['signals']
+
+    def get_pump_dump_history(self, hours=24):
+        if not self.loaded:
+            QUERIES.inc(query='pump_dump', tier='cold')
+            return self.db.get_pump_dump_history(hours)
+
+        since = self._db_time_ago(hours)
+        hot = self.tables['pump_dump_alerts']
+        with self.lock:
+            start = hot.start
+            alerts = [dict(row) for row in hot.scan(max(since, start))]
+        if since < start:
+            QUERIES.inc(query='pump_dump', tier='merged')
+            alerts += self.db.get_pump_dump_history(hours, until=start)
+        else:
+            QUERIES.inc(query='pump_dump', tier='hot')
+        return alerts
+
+    def get_signal_validations(self, signal_id):
+        """اعتبارسنجیهای یک سیگنال (قدیمی به جدید)"""
+        hot = self.tables['signal_validations']
+        with self.lock:
+            start = hot.start if self.loaded else None
+            checks = [dict(hot.rows[i]) for i in hot.groups.get(signal_id, [])]
+        if start is not None and self._signal_is_hot(signal_id, start):
+            QUERIES.inc(query='validations', tier='hot')
+            return sorted(checks, key=lambda v: (v['check_time'], v['id']))
+        QUERIES.inc(query='validations', tier='cold')
+        return self.db.get_signal_validations(signal_id)
+
+    def _signal_is_hot(self, signal_id, start):
+        # اعتبارسنجیها بعد از ساخت سیگنال ثبت میشوند؛ سیگنال داغ = همه اعتبارسنجیها در حافظه
+        with self.lock:
+            row = self.tables['signals'].rows.get(signal_id)
+            return row is not None and row['created_at'] >= start
+
+    def _db_time_ago(self, hours):
+        return self.db._db_time(datetime.utcnow() - timedelta(hours=hours))
+
+
+# نمونه گلوبال
+hot_tier = HotTier(signal_db)
@@ -0,0 +1,109 @@
+"""
+جدول امتیاز ترکیبی همه ارزها (STRONG_BUY / STRONG_SELL)
+با هر بار تحلیل یک ارز فقط رکورد همان ارز بروزرسانی میشود
+"""
+from bisect import bisect_left, insort
+from datetime import datetime
+import threading
+
+from advanced_signals import UltimateSignalGenerator
+
+SIDES = {'STRONG_BUY': 'buy', 'STRONG_SELL': 'sell'}
+
+
+class ScoreLeaderboard:
+    """لیست مرتب امتیازها برای هر سمت"""
+
+    def __init__(self, watch_top=20):
+        self.watch_top = watch_top
+        self.lock = threading.Lock()
+        self.ranked = {'buy': [], 'sell': []}  # [(-score, symbol)]
+        self.entries = {}  # symbol -> (side, key, data)
+
+    def _remove(self, symbol):
+        """حذف رکورد قبلی؛ خروجی رتبه قبلی"""
+        entry = self.entries.pop(symbol, None)
+        if entry is None:
+            return None
+        side, key, _ = entry
+        ranked = self.ranked[side]
+        pos = bisect_left(ranked, key)
+        if pos < len(ranked) and ranked[pos] == key:
+            del ranked[pos]
+            return side, pos
+        return None
+
+    def update(self, symbol, signals, price=0):
+        """بروزرسانی امتیاز یک ارز؛ True اگر N برتر تغییر کند"""
+        score = UltimateSignalGenerator.score_signals(signals, symbol, price)
+        side = SIDES.get(score['recommendation'])
+
+        with self.lock:
+            old = self._remove(symbol)
+            changed = old is not None and old[1] < self.watch_top
+
+            if side is not None:
+                key = (-score['score'], symbol)
+                score['updated_at'] = datetime.utcnow().isoformat()
+                self.entries[symbol] = (side, key, score)
+                ranked = self.ranked[side]
+                insort(ranked, key)
+                changed = changed or bisect_left(ranked, key) < self.watch_top
+
+        return changed
+
+    def discard(self, symbol):
+        """حذف ارز از جدول"""
+        with self.lock:
+            old = self._remove(symbol)
+        return old is not None and old[1] < self.watch_top
+
+    def clear(self):
+        """پاک کردن کل جدول (مثلا بعد از تغییر صرافی)"""
+        with self.lock:
+            self.ranked = {'buy': [], 'sell': []}
+            self.entries = {}
+
+    def load(self, scores):
+        """جایگزینی کل جدول با امتیازهای آماده (ترکیب جدول اسکنرهای جدا در پردازه وب)"""
+        ranked = {'buy': [], 'sell': []}
+        entries = {}
+        for score in scores:
+            side = SIDES.get(score.get('recommendation'))
+            if side is None:
+                continue
+            key = (-score['score'], score['symbol'])
+            entries[score['symbol']] = (side, key, score)
+            ranked[side].append(key)
+        for keys in ranked.values():
+            keys.sort()
+        with self.lock:
+            self.ranked = ranked
+            self.entries = entries
+
+    def top(self, side='buy', limit=20):
+        """N ارز برتر یک سمت"""
+        with self.lock:
+            keys = self.ranked.get(side, [])[:limit]
+            return [self.entries[symbol][2] for _, symbol in keys]
+
+    def rank(self, symbol):
+        """رتبه یک ارز"""
+        with self.lock:
+            entry = self.entries.get(symbol)
+            if entry is None:
+                return None
+            side, key, data = entry
+            return {'side': side, 'rank': bisect_left(self.ranked[side], key) + 1, **data}
+
+    def snapshot(self, limit=20):
+        """هر دو سمت برای ارسال به کلاینت"""
+        return {
+            'buy': self.top('buy', limit),
+            'sell': self.top('sell', limit),
+            'count': len(self.entries)
+        }
+
+
+# نمونه گلوبال
+leaderboard = ScoreLeaderboard()
@@ -0,0 +1,245 @@
+"""
+متریکها با فرمت متنی Prometheus برای /api/metrics
+پردازههای فرزند (اسکنر، اعتبارسنج) متریکها را روی پورت خود سرو میکنند و پردازه وب همه را ترکیب میکند
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _add_label(line, name, value):
+    """افزودن یک برچسب ثابت به یک خط نمونه"""
+    pair = f'{name}="{_escape(value)}"'
+    brace, space = line.find('{'), line.find(' ')
+    if brace != -1 and brace < space:
+        return f'{line[:brace + 1]}{pair},{line[brace + 1:]}'
+    return f'{line[:space]}{{{pair}}}{line[space:]}'
+
+
+class _Timer:
+    """زمانسنج؛ هم به صورت with و هم decorator"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+    def __call__(self, func):
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = list(self.values.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func  # مقدار لحظهای هنگام خواندن: func() -> {labels_tuple: value}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        if self.func is not None:
+            try:
+                items = list(self.func().items())
+            except Exception as e:
+                items = []
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        return self.header() + [f'{self.name}{_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            pos = bisect_left(self.buckets, value)
+            if pos < len(self.buckets):
+                state[0][pos] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        with self.lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self.values.items()]
+
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, ("le", bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    """ثبت و خروجی همه متریکها"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self._get(Gauge, name, documentation, labelnames, func)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self, process=None):
+        """خروجی متنی؛ با process همه نمونهها برچسب پردازه میگیرند"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        if process is not None:
+            lines = [line if line.startswith('#') else _add_label(line, 'process', process) for line in lines]
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=None, process=None):
+        """سرو متریکهای این پردازه برای پردازه وب (METRICS_PORT و METRICS_PROCESS از supervisor)"""
+        port = port or int(os.environ.get('METRICS_PORT', 0))
+        if not port:
+            return None
+        process = process or os.environ.get('METRICS_PROCESS', str(os.getpid()))
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render(process).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics for {process} on 127.0.0.1:{port}")
+        return server
+
+
+def scrape(targets, timeout=2):
+    """خواندن متریک پردازههای فرزند؛ پردازه در دسترس نبودن فقط حذف میشود"""
+    texts = []
+    for target in targets:
+        try:
+            with urlopen(f'http://{target}/', timeout=timeout) as response:
+                texts.append(response.read().decode())
+        except Exception as e:
+            print(f"Metrics scrape error ({target}): {e}")
+    return texts
+
+
+def merge(texts):
+    """ترکیب خروجی چند پردازه؛ HELP/TYPE هر متریک یکبار و نمونههای همه پردازهها زیر آن"""
+    families = {}
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                family = families.setdefault(line.split(' ', 3)[2], {'header': [], 'samples': []})
+                if line not in family['header']:
+                    family['header'].append(line)
+            elif line and family is not None:
+                family['samples'].append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(family['header'])
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n'
+
+
+# نمونه گلوبال
+registry = Registry()
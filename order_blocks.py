@@ -0,0 +1,226 @@
+"""
+ایندکس ناحیههای Order Block فعال هر ارز
+تشخیص بازگشت قیمت به ناحیه (Retest)، ابطال (Mitigation) و انقضا
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+import heapq
+import threading
+
+import pandas as pd
+
+from database import signal_db
+
+
+class SymbolZones:
+    """ناحیههای یک ارز مرتب بر اساس کف"""
+
+    def __init__(self):
+        self.by_bottom = []          # [(bottom, zone_id)]
+        self.zones = {}              # zone_id -> zone
+        self.expiry = []             # heap: (expires_at, zone_id, key)
+        self.keys = set()            # (direction, formed_at) ناحیههای ثبت شده تا انقضا (حتی بسته شده)
+        self.max_height = 0.0
+        self.last_ts = None
+
+    @staticmethod
+    def key(zone):
+        return zone['direction'], zone['formed_at']
+
+    def add(self, zone):
+        self.zones[zone['id']] = zone
+        insort(self.by_bottom, (zone['bottom'], zone['id']))
+        heapq.heappush(self.expiry, (zone['expires_at'], zone['id'], self.key(zone)))
+        self.keys.add(self.key(zone))
+        self.max_height = max(self.max_height, zone['top'] - zone['bottom'])
+
+    def remove(self, zone_id):
+        zone = self.zones.pop(zone_id, None)
+        if zone is not None:
+            key = (zone['bottom'], zone_id)
+            pos = bisect_left(self.by_bottom, key)
+            if pos < len(self.by_bottom) and self.by_bottom[pos] == key:
+                del self.by_bottom[pos]
+        return zone
+
+    def overlapping(self, low, high):
+        """ناحیههایی که با بازه [low, high] همپوشانی دارند"""
+        # کف ناحیه حداکثر max_height پایینتر از low است
+        start = bisect_left(self.by_bottom, (low - self.max_height, -1))
+        end = bisect_right(self.by_bottom, (high, float('inf')))
+        return [
+            self.zones[zone_id]
+            for _, zone_id in self.by_bottom[start:end]
+            if self.zones[zone_id]['top'] >= low
+        ]
+
+
+class OrderBlockZoneIndex:
+    """ایندکس ماندگار ناحیههای Order Block همه ارزها"""
+
+    def __init__(self, ttl_hours=48):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.symbols = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def _load(self):
+        """بارگذاری ناحیههای فعال از دیتابیس"""
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            for row in signal_db.get_active_order_block_zones():
+                self.symbols.setdefault(row['symbol'], SymbolZones()).add(row)
+        except Exception as e:
+            print(f"❌ Error loading order block zones: {e}")
+
+    def last_seen(self):
+        """آخرین کندل بررسی شده هر ارز (برای checkpoint)"""
+        with self.lock:
+            return {symbol: zones.last_ts for symbol, zones in self.symbols.items()}
+
+    def restore(self, last_seen):
+        """بازیابی بعد از ری‌استارت: ناحیهها از دیتابیس (منبع اصلی)، فقط آخرین کندل از checkpoint"""
+        with self.lock:
+            self.symbols = {}
+            self.loaded = False
+            self._load()
+            for symbol, last_ts in last_seen.items():
+                self.symbols.setdefault(symbol, SymbolZones()).last_ts = last_ts
+
+    def reset(self):
+        """ناحیههای صرافی قبلی دیگر معتبر نیستند؛ در دیتابیس هم بسته میشوند تا دوباره بارگذاری نشوند"""
+        with self.lock:
+            self._load()
+            zone_ids = [zone_id for zones in self.symbols.values() for zone_id in zones.zones]
+            self.symbols = {}
+        if zone_ids:
+            signal_db.expire_order_block_zones(zone_ids)
+
+    def add_zone(self, signal, symbol):
+        """ثبت ناحیه از سیگنال Order Block"""
+        if signal.get('top') is None or signal.get('bottom') is None:
+            return None
+
+        formed_at = pd.Timestamp(signal.get('timestamp') or datetime.utcnow())
+        zone = {
+            'symbol': symbol,
+            'direction': signal['signal'],
+            'top': float(signal['top']),
+            'bottom': float(signal['bottom']),
+            'strength': int(signal.get('strength', 50)),
+            'formed_at': formed_at.isoformat(),
+            'expires_at': (formed_at + self.ttl).isoformat(),
+            'status': 'ACTIVE',
+            'retests': 0,
+            'last_retest_at': None
+        }
+        if zone['expires_at'] <= datetime.utcnow().isoformat():
+            return None  # ناحیه قدیمی پنجره که قبلا منقضی شده
+
+        zones = self.symbols.setdefault(symbol, SymbolZones())
+        if SymbolZones.key(zone) in zones.keys:
+            return None  # قبلا ثبت شده؛ بدون نوشتن در دیتابیس
+
+        zone_id = signal_db.save_order_block_zone(zone)
+        if zone_id is None:
+            return None  # در دیتابیس هست (مثلا بسته شده)
+
+        zone['id'] = zone_id
+        zones.add(zone)
+        return zone
+
+    def _close(self, zones, zone_id, status):
+        zone = zones.remove(zone_id)
+        if zone is not None:
+            signal_db.update_order_block_zone(zone_id, status, zone['retests'], zone['last_retest_at'])
+
+    def _expire(self, zones, now):
+        """بستن ناحیههای منقضی به ترتیب expires_at"""
+        while zones.expiry and zones.expiry[0][0] <= now:
+            _, zone_id, key = heapq.heappop(zones.expiry)
+            zones.keys.discard(key)
+            if zone_id in zones.zones:
+                self._close(zones, zone_id, 'EXPIRED')
+
+    def _check_bar(self, zones, symbol, bar):
+        """بررسی یک کندل بسته شده"""
+        ts = bar['timestamp'].isoformat()
+        retests = []
+
+        for zone in zones.overlapping(bar['low'], bar['high']):
+            if ts <= zone['formed_at'] or zone['last_retest_at'] == ts:
+                continue
+
+            bullish = zone['direction'] == 'BUY'
+            if (bullish and bar['close'] < zone['bottom']) or (not bullish and bar['close'] > zone['top']):
+                self._close(zones, zone['id'], 'MITIGATED')
+                continue
+
+            zone['retests'] += 1
+            zone['last_retest_at'] = ts
+            signal_db.update_order_block_zone(zone['id'], 'ACTIVE', zone['retests'], ts)
+
+            retests.append({
+                'symbol': symbol,
+                'type': 'BULLISH_ORDER_BLOCK_RETEST' if bullish else 'BEARISH_ORDER_BLOCK_RETEST',
+                'signal': zone['direction'],
+                'strength': min(zone['strength'] + 10 - zone['retests'] * 5, 95),
+                'price': bar['close'],
+                'top': zone['top'],
+                'bottom': zone['bottom'],
+                'stop_loss': zone['bottom'] * 0.995 if bullish else zone['top'] * 1.005,
+                'reason': f"📦 {'Bullish' if bullish else 'Bearish'} Order Block Retest "
+                          f"({zone['bottom']:.4f} - {zone['top']:.4f}, #{zone['retests']})",
+                'timestamp': bar['timestamp']
+            })
+
+        return retests
+
+    def process(self, symbol, df, signals):
+        """ثبت ناحیههای جدید و بررسی کندلهای بسته شده جدید"""
+        if len(df) < 2 or 'timestamp' not in df.columns:
+            return []
+
+        with self.lock:
+            self._load()
+
+            for sig in signals:
+                if 'ORDER_BLOCK' in sig.get('type', '') and 'RETEST' not in sig.get('type', ''):
+                    self.add_zone(sig, symbol)
+
+            zones = self.symbols.get(symbol)
+            if zones is None:
+                return []
+
+            self._expire(zones, datetime.utcnow().isoformat())
+
+            # کندل آخر هنوز بسته نشده
+            closed = df.iloc[:-1]
+            if zones.last_ts is not None:
+                closed = closed[closed['timestamp'] > zones.last_ts]
+            else:
+                closed = closed.tail(1)
+
+            retests = []
+            for _, bar in closed.iterrows():
+                retests.extend(self._check_bar(zones, symbol, bar))
+
+            if len(closed):
+                zones.last_ts = closed['timestamp'].iloc[-1]
+
+            return retests
+
+    def get_zones(self, symbol):
+        """ناحیههای فعال یک ارز"""
+        with self.lock:
+            self._load()
+            zones = self.symbols.get(symbol)
+            if zones is None:
+                return []
+            return sorted(zones.zones.values(), key=lambda z: z['bottom'])
+
+
+# نمونه گلوبال
+zone_index = OrderBlockZoneIndex()
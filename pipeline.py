@@ -0,0 +1,145 @@
+"""
+پایپلاین مرحلهای با صفهای محدود
+هر مرحله تعداد کارگر خودش را دارد؛ صف پر یعنی مرحله قبل منتظر میماند (backpressure)
+"""
+from collections import deque
+import itertools
+import queue
+import threading
+import time
+
+from metrics import registry
+
+STAGE_SECONDS = registry.histogram('pipeline_stage_seconds', 'Time spent handling one item per stage', ['stage'])
+STAGE_ERRORS = registry.counter('pipeline_stage_errors_total', 'Items whose handler raised', ['stage'])
+
+_STOP = object()
+
+
+class Stage:
+    """یک مرحله پایپلاین"""
+
+    def __init__(self, name, handler, workers=1, maxsize=100):
+        self.name = name
+        self.handler = handler          # item -> iterable خروجی یا None
+        self.workers = workers
+        self.queue = queue.PriorityQueue(maxsize)
+        self.next_stage = None
+        self.threads = []
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=500)
+        self.waits = deque(maxlen=500)
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0
+
+    def put(self, item, priority=1):
+        """افزودن به صف؛ اگر صف پر باشد منتظر میماند"""
+        self.queue.put((priority, next(self.seq), time.time(), item))
+
+    def _run(self):
+        while True:
+            priority, _, queued_at, item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                break
+
+            started = time.time()
+            with self.lock:
+                self.busy += 1
+            try:
+                outputs = self.handler(item)
+                if outputs is not None and self.next_stage is not None:
+                    for out in outputs:
+                        self.next_stage.put(out, priority)
+                with self.lock:
+                    self.processed += 1
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                STAGE_ERRORS.inc(stage=self.name)
+                print(f"❌ Stage {self.name} error: {e}")
+            finally:
+                elapsed = time.time() - started
+                with self.lock:
+                    self.busy -= 1
+                    self.waits.append(started - queued_at)
+                    self.latencies.append(elapsed)
+                STAGE_SECONDS.observe(elapsed, stage=self.name)
+                # زمان هر مرحله برای trace چرخه
+                if isinstance(item, dict):
+                    item.setdefault('timings', {})[self.name] = elapsed
+                self.queue.task_done()
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put((float('inf'), next(self.seq), time.time(), _STOP))
+        self.threads = []
+
+    @staticmethod
+    def _ms(values, q=None):
+        if not values:
+            return 0.0
+        if q is None:
+            return round(sum(values) / len(values) * 1000, 2)
+        ordered = sorted(values)
+        return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000, 2)
+
+    def metrics(self):
+        """وضعیت صف و زمان پردازش"""
+        with self.lock:
+            latencies = list(self.latencies)
+            waits = list(self.waits)
+            return {
+                'stage': self.name,
+                'workers': self.workers,
+                'busy': self.busy,
+                'queue_depth': self.queue.qsize(),
+                'queue_max': self.queue.maxsize,
+                'processed': self.processed,
+                'errors': self.errors,
+                'latency_avg_ms': self._ms(latencies),
+                'latency_p95_ms': self._ms(latencies, 0.95),
+                'queue_wait_avg_ms': self._ms(waits)
+            }
+
+
+class Pipeline:
+    """زنجیره مراحل"""
+
+    def __init__(self, stages):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            for stage in self.stages:
+                stage.start()
+            self.started = True
+
+    def stop(self):
+        if self.started:
+            for stage in self.stages:
+                stage.stop()
+            self.started = False
+
+    def submit(self, item, priority=1):
+        """ورود به مرحله اول (priority کمتر = زودتر)"""
+        self.stages[0].put(item, priority)
+
+    def join(self):
+        """انتظار تا خالی شدن همه صفها"""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def metrics(self):
+        return [stage.metrics() for stage in self.stages]
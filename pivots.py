@@ -0,0 +1,138 @@
+"""
+ایندکس نقاط چرخش (Swing High / Swing Low) برای تشخیص واگرایی
+برای هر ارز فقط کندلهای جدید بررسی میشوند
+"""
+from collections import deque
+import threading
+
+import numpy as np
+
+
+class SwingPivotIndex:
+    """نقاط چرخش تایید شده قیمت همراه با RSI و MACD همان کندل"""
+
+    def __init__(self, order=3, max_pivots=20):
+        self.order = order          # تعداد کندل دو طرف برای تایید
+        self.max_pivots = max_pivots
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def _new_state(self):
+        return {
+            'last_ts': None,
+            'highs': deque(maxlen=self.max_pivots),
+            'lows': deque(maxlen=self.max_pivots)
+        }
+
+    def update(self, df, rsi, macd, symbol=None):
+        """بروزرسانی ایندکس با کندلهای جدید"""
+        k = self.order
+        n = len(df)
+        highs = df['high'].values
+        lows = df['low'].values
+        rsi = np.asarray(rsi, dtype=float)
+        macd = np.asarray(macd, dtype=float)
+        ts = df['timestamp'].values if 'timestamp' in df.columns else None
+        if symbol is None and 'symbol' in df.columns and n:
+            symbol = df['symbol'].iloc[0]
+        incremental = symbol is not None and ts is not None
+
+        with self.lock:
+            state = self.states.get(symbol) if incremental else None
+            start = k
+
+            if state is not None and state['last_ts'] is not None:
+                pos = np.searchsorted(ts, state['last_ts'])
+                if pos < n and ts[pos] == state['last_ts']:
+                    start = max(pos + 1, k)
+                else:
+                    # فاصله با دادههای قبلی؛ ساخت دوباره
+                    state = None
+            if state is None:
+                state = self._new_state()
+
+            # کندل آخر هنوز بسته نشده؛ فقط کندلهای بسته شده نقطه چرخش را تایید میکنند
+            m = n - 1
+            for i in range(start, m - k):
+                h = highs[i]
+                if h > highs[i - k:i].max() and h >= highs[i + 1:i + k + 1].max():
+                    state['highs'].append(self._pivot(i, ts, h, rsi, macd))
+                low = lows[i]
+                if low < lows[i - k:i].min() and low <= lows[i + 1:i + k + 1].min():
+                    state['lows'].append(self._pivot(i, ts, low, rsi, macd))
+
+            if ts is not None and m - k - 1 >= k:
+                state['last_ts'] = ts[m - k - 1]
+
+            # حذف نقاط خارج از پنجره فعلی
+            if ts is not None and n:
+                for key in ('highs', 'lows'):
+                    while state[key] and state[key][0]['ts'] < ts[0]:
+                        state[key].popleft()
+
+            if incremental:
+                self.states[symbol] = state
+
+            pivots = {'highs': list(state['highs']), 'lows': list(state['lows'])}
+
+        # موقعیت هر نقطه در پنجره فعلی
+        if ts is not None:
+            for key in ('highs', 'lows'):
+                pivots[key] = [dict(p, index=int(np.searchsorted(ts, p['ts']))) for p in pivots[key]]
+        return pivots
+
+    @staticmethod
+    def _pivot(i, ts, price, rsi, macd):
+        return {
+            'index': i,
+            'ts': ts[i] if ts is not None else None,
+            'price': float(price),
+            'rsi': float(rsi[i]),
+            'macd': float(macd[i])
+        }
+
+    @staticmethod
+    def divergences(pivots, oversold=40, overbought=60):
+        """مقایسه هر نقطه با نقطه چرخش قبلی هم نوع"""
+        found = []
+
+        lows = pivots['lows']
+        for prev, last in zip(lows, lows[1:]):
+            if last['price'] < prev['price'] and last['rsi'] > prev['rsi'] and last['rsi'] < oversold:
+                found.append(('BULLISH', prev, last, last['macd'] > prev['macd']))
+
+        highs = pivots['highs']
+        for prev, last in zip(highs, highs[1:]):
+            if last['price'] > prev['price'] and last['rsi'] < prev['rsi'] and last['rsi'] > overbought:
+                found.append(('BEARISH', prev, last, last['macd'] < prev['macd']))
+
+        found.sort(key=lambda d: d[2]['index'])
+        return found
+
+    def get_state(self, symbol):
+        """وضعیت یک ارز برای ارسال به پردازه کارگر"""
+        with self.lock:
+            return self.states.get(symbol)
+
+    def set_state(self, symbol, state):
+        with self.lock:
+            if state is None:
+                self.states.pop(symbol, None)
+            else:
+                self.states[symbol] = state
+
+    def pop_state(self, symbol):
+        with self.lock:
+            return self.states.pop(symbol, None)
+
+    def clear(self, symbol=None):
+        """پاک کردن ایندکس"""
+        with self.lock:
+            if symbol is None:
+                self.states.clear()
+            else:
+                self.states.pop(symbol, None)
+
+
+# نمونه گلوبال (در استخر تحلیل، وضعیت در پردازه اصلی نگه داشته و همراه کندلها ارسال میشود)
+pivot_index = SwingPivotIndex()
@@ -0,0 +1,175 @@
+"""
+پیشغربالگری پامپ و دامپ برای همه ارزها از روی تیکرهای لحظهای
+ارزهای مشکوک برای تحلیل کامل در صف اولویت قرار میگیرند
+"""
+from collections import OrderedDict, deque
+from datetime import datetime
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_fetcher import exchange_manager
+
+
+class TickerPreScreen:
+    """مقایسه برداری دو snapshot از fetch_tickers"""
+
+    def __init__(self, interval=10, window=300, price_threshold=2.0,
+                 volume_ratio=2.0, cooldown=600):
+        self.interval = interval            # فاصله snapshot ها (ثانیه)
+        self.window = window                # بازه مقایسه (ثانیه)
+        self.price_threshold = price_threshold
+        self.volume_ratio = volume_ratio    # نسبت حجم بازه به میانگین ۲۴ ساعته
+        self.cooldown = cooldown
+        self.snapshots = deque()
+        self.candidates = OrderedDict()
+        self.flagged = deque(maxlen=100)
+        self.last_flagged = {}
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def take_snapshot(self):
+        """دریافت همه تیکرها در یک درخواست"""
+        tickers = exchange_manager.get_all_tickers()
+        if not tickers:
+            return None
+
+        universe = set(exchange_manager.symbols)
+        rows = {
+            symbol: (t.get('last'), t.get('quoteVolume'))
+            for symbol, t in tickers.items()
+            if not universe or symbol in universe
+        }
+        snapshot = pd.DataFrame.from_dict(rows, orient='index', columns=['last', 'quote_volume'], dtype=float)
+        return time.time(), snapshot
+
+    def _reference(self, now):
+        """قدیمیترین snapshot داخل بازه"""
+        while len(self.snapshots) > 1 and now - self.snapshots[1][0] >= self.window:
+            self.snapshots.popleft()
+        return self.snapshots[0] if self.snapshots else None
+
+    def screen(self, now, current, ref_time, reference):
+        """محاسبه برداری تغییرات قیمت و حجم"""
+        ref = reference.reindex(current.index)
+        elapsed = max(now - ref_time, 1)
+
+        price_change = (current['last'].values / ref['last'].values - 1) * 100
+
+        # حجم ۲۴ ساعته غلتان است: افزایش آن = حجم بازه منهای حجم خارج شده از ابتدای پنجره
+        # پس max(افزایش، 0) کران پایین حجم بازه است (تقریبی، بدون امتیاز منفی یا کاذب در بازار آرام)
+        # نسبت به نرخ میانگین ۲۴ ساعته مرجع: (جاری / مرجع - 1) * 86400 / بازه
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ref_volume = ref['quote_volume'].values
+            growth = np.where(ref_volume > 0, current['quote_volume'].values / ref_volume, np.nan)
+            vol_ratio = np.maximum(growth - 1, 0) * 86400 / elapsed
+
+        active = np.abs(price_change) >= self.price_threshold
+        active &= np.nan_to_num(vol_ratio) >= self.volume_ratio
+        active &= np.isfinite(price_change)
+
+        alerts = []
+        for i in np.flatnonzero(active):
+            change = float(price_change[i])
+            alerts.append({
+                'symbol': current.index[i],
+                'alert_type': 'PUMP_CANDIDATE' if change > 0 else 'DUMP_CANDIDATE',
+                'signal': 'BUY' if change > 0 else 'SELL',
+                'price': float(current['last'].values[i]),
+                'price_change': round(change, 2),
+                'volume_ratio': round(float(vol_ratio[i]), 2),
+                'volume_growth': round(float(growth[i]), 4),
+                'window_seconds': int(elapsed),
+                'detected_at': datetime.utcnow().isoformat()
+            })
+        return alerts
+
+    def run_once(self):
+        """یک مرحله پیشغربالگری"""
+        snap = self.take_snapshot()
+        if snap is None:
+            return []
+
+        now, current = snap
+        with self.lock:
+            ref = self._reference(now)
+            self.snapshots.append(snap)
+        if ref is None:
+            return []
+
+        alerts = self.screen(now, current, *ref)
+        queued = []
+        with self.lock:
+            for alert in alerts:
+                symbol = alert['symbol']
+                if now - self.last_flagged.get(symbol, 0) < self.cooldown:
+                    continue
+                self.last_flagged[symbol] = now
+                self.candidates[symbol] = alert
+                self.flagged.append(alert)
+                queued.append(alert)
+
+        if queued:
+            self.event.set()
+            print(f"⚡ Pre-screen flagged {len(queued)}: {', '.join(a['symbol'] for a in queued)}")
+        return queued
+
+    def pop_candidates(self, limit=None):
+        """برداشتن ارزهای صف اولویت"""
+        with self.lock:
+            symbols = []
+            while self.candidates and (limit is None or len(symbols) < limit):
+                symbol, _ = self.candidates.popitem(last=False)
+                symbols.append(symbol)
+            if not self.candidates:
+                self.event.clear()
+            return symbols
+
+    def wait_candidates(self, timeout):
+        """انتظار برای ارز مشکوک جدید"""
+        return self.event.wait(timeout)
+
+    def get_flagged(self):
+        """هشدارهای اخیر"""
+        with self.lock:
+            return list(self.flagged)
+
+    def clear(self):
+        """پاک کردن snapshot ها و صف (مثلا بعد از تغییر صرافی)"""
+        with self.lock:
+            self.snapshots.clear()
+            self.candidates.clear()
+            self.event.clear()
+
+    def load_flagged(self, alerts):
+        """جایگزینی هشدارهای اخیر (ترکیب پیشغربالگری اسکنرهای جدا در پردازه وب)"""
+        with self.lock:
+            self.flagged = deque(alerts, maxlen=self.flagged.maxlen)
+
+    def run_loop(self):
+        """حلقه پیشغربالگری"""
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Pre-screen error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """شروع"""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.thread.start()
+            print(f"⚡ Ticker pre-screen started (every {self.interval}s)")
+
+    def stop(self):
+        """توقف"""
+        self.running = False
+
+
+prescreen = TickerPreScreen()
@@ -0,0 +1,282 @@
+"""
+نگهداری دیتابیس: خلاصهسازی اعتبارسنجیها، بایگانی ردیفهای قدیمی و vacuum تدریجی
+بایگانی در فایلهای ماهانه ndjson.gz که با query_archive قابل جستجو هستند
+"""
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+import threading
+import time
+
+from database import signal_db
+from metrics import registry
+
+RUN_SECONDS = registry.histogram('retention_run_seconds', 'Duration of one retention pass')
+ROWS = registry.counter('retention_rows_total', 'Rows compacted or archived', ['table', 'action'])
+DB_BYTES = registry.gauge('signals_db_bytes', 'Size of signals.db (pages in use)')
+
+# جدول -> ستون زمان، شرط بایگانی
+ARCHIVE_TABLES = {
+    'signals': ('created_at', "status != 'ACTIVE'"),
+    'pump_dump_alerts': ('detected_at', '1 = 1')
+}
+
+
+class RetentionManager:
+    """نگه داشتن دیتابیس کوچک و سریع"""
+
+    def __init__(self, db, archive_dir='archive', hot_days=14, validation_hot_days=2,
+                 batch_size=2000, vacuum_pages=2000, interval=3600):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.hot_days = hot_days                        # ردیفهای جدیدتر در دیتابیس میمانند
+        self.validation_hot_days = validation_hot_days  # اعتبارسنجیهای جزئی سیگنالهای بسته شده
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.interval = interval
+        self.running = False
+        self.thread = None
+        self.last_run = None
+        self.vacuum_hinted = False
+
+    @staticmethod
+    def _cutoff(days):
+        return (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    # ---------- خلاصهسازی ----------
+
+    def rollup_validations(self):
+        """جایگزینی ردیفهای اعتبارسنجی سیگنالهای بسته شده با یک ردیف خلاصه"""
+        cutoff = self._cutoff(self.validation_hot_days)
+        total = 0
+        while True:
+            with self.db.pool.write() as conn:
+                ids = [row[0] for row in conn.execute('''
+                    SELECT id FROM signals s
+                    WHERE status = 'CLOSED' AND closed_at < ?
+                      AND EXISTS (SELECT 1 FROM signal_validations v WHERE v.signal_id = s.id)
+                    LIMIT ?
+                ''', (cutoff, self.batch_size)).fetchall()]
+                if not ids:
+                    break
+
+                marks = ','.join('?' * len(ids))
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO validation_summaries
+                    SELECT v.signal_id, COUNT(*), MIN(v.check_time), MAX(v.check_time),
+                        (SELECT current_price FROM signal_validations f
+                         WHERE f.signal_id = v.signal_id ORDER BY f.check_time, f.id LIMIT 1),
+                        (SELECT current_price FROM signal_validations l
+                         WHERE l.signal_id = v.signal_id ORDER BY l.check_time DESC, l.id DESC LIMIT 1),
+                        MIN(v.current_price), MAX(v.current_price),
+                        MIN(v.price_change_pct), MAX(v.price_change_pct),
+                        s.validation_result,
+                        (julianday(s.closed_at) - julianday(s.created_at)) * 86400
+                    FROM signal_validations v JOIN signals s ON s.id = v.signal_id
+                    WHERE v.signal_id IN ({marks})
+                    GROUP BY v.signal_id
+                ''', ids)
+                deleted = conn.execute(f'DELETE FROM signal_validations WHERE signal_id IN ({marks})', ids).rowcount
+                conn.commit()
+            total += deleted
+            ROWS.inc(deleted, table='signal_validations', action='rolled_up')
+        return total
+
+    # ---------- بایگانی ----------
+
+    def _partition_path(self, table, month):
+        return os.path.join(self.archive_dir, table, f'{month}.ndjson.gz')
+
+    def _append(self, table, rows, time_column):
+        """افزودن به فایلهای ماهانه؛ هر بار یک عضو gzip جدید"""
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row[time_column])[:7], []).append(row)
+        for month, part in by_month.items():
+            path = self._partition_path(table, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    for row in part:
+                        f.write(json.dumps(row, default=str, separators=(',', ':')).encode() + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def archive_table(self, table):
+        """انتقال ردیفهای قدیمی به بایگانی و حذف از دیتابیس"""
+        time_column, condition = ARCHIVE_TABLES[table]
+        cutoff = self._cutoff(self.hot_days)
+        total = 0
+        while True:
+            with self.db.pool.read() as conn:
+                rows = [dict(row) for row in conn.execute(f'''
+                    SELECT * FROM {table}
+                    WHERE {time_column} < ? AND {condition}
+                    ORDER BY id LIMIT ?
+                ''', (cutoff, self.batch_size)).fetchall()]
+                if not rows:
+                    break
+                ids = [row['id'] for row in rows]
+                marks = ','.join('?' * len(ids))
+
+                last_check = None
+                if table == 'signals':
+                    # خلاصه و اعتبارسنجیهای باقیمانده همراه سیگنال بایگانی میشوند
+                    summaries = {
+                        row['signal_id']: dict(row) for row in conn.execute(
+                            f'SELECT * FROM validation_summaries WHERE signal_id IN ({marks})', ids)
+                    }
+                    checks = {}
+                    last_check = 0
+                    for row in conn.execute(
+                            f'SELECT * FROM signal_validations WHERE signal_id IN ({marks}) ORDER BY id', ids):
+                        checks.setdefault(row['signal_id'], []).append(dict(row))
+                        last_check = row['id']
+                    for row in rows:
+                        row['validation'] = summaries.get(row['id'])
+                        row['checks'] = checks.get(row['id'], [])
+
+            # اول فایل (fsync) بدون قفل نوشتن، بعد حذف؛ در بدترین حالت ردیف تکراری در بایگانی که هنگام خواندن حذف میشود
+            self._append(table, rows, time_column)
+            with self.db.pool.write() as conn:
+                if table == 'signals':
+                    conn.execute(f'DELETE FROM validation_summaries WHERE signal_id IN ({marks})', ids)
+                    # فقط اعتبارسنجیهایی که در فایل نوشته شدند
+                    conn.execute(f'DELETE FROM signal_validations WHERE signal_id IN ({marks}) AND id <= ?',
+                                 ids + [last_check])
+                conn.execute(f'DELETE FROM {table} WHERE id IN ({marks})', ids)
+                conn.commit()
+            total += len(rows)
+            ROWS.inc(len(rows), table=table, action='archived')
+        return total
+
+    def _month_files(self, table, since=None, until=None, reverse=False):
+        """فایلهای ماههای داخل بازه"""
+        folder = os.path.join(self.archive_dir, table)
+        if not os.path.isdir(folder):
+            return []
+        return [
+            os.path.join(folder, name) for name in sorted(os.listdir(folder), reverse=reverse)
+            if not (since and name[:7] < since[:7] or until and name[:7] > until[:7])
+        ]
+
+    def _read_month(self, path, time_column, since=None, until=None):
+        # ردیف تکراری فقط داخل همان فایل ماه ممکن است
+        seen = set()
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                row = json.loads(line)
+                ts = str(row.get(time_column))
+                if since and ts < since or until and ts >= until:
+                    continue
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                yield row
+
+    def iter_archive(self, table, since=None, until=None, reverse=False):
+        """خواندن جریانی بایگانی، ماه به ماه"""
+        time_column, _ = ARCHIVE_TABLES[table]
+        since = str(since) if since else None
+        until = str(until) if until else None
+        for path in self._month_files(table, since, until, reverse):
+            yield from self._read_month(path, time_column, since, until)
+
+    def query_archive(self, table, since=None, until=None, limit=1000, **filters):
+        """جستجو در بایگانی؛ ماهها از جدید به قدیم، توقف بعد از limit ردیف"""
+        time_column, _ = ARCHIVE_TABLES[table]
+        since = str(since) if since else None
+        until = str(until) if until else None
+        results = []
+        for path in self._month_files(table, since, until, reverse=True):
+            month = [
+                row for row in self._read_month(path, time_column, since, until)
+                if not any(value is not None and row.get(key) != value for key, value in filters.items())
+            ]
+            month.sort(key=lambda r: (str(r.get(time_column)), r['id']), reverse=True)
+            results.extend(month[:limit - len(results)])
+            if len(results) >= limit:
+                break
+        return results
+
+    # ---------- vacuum ----------
+
+    def vacuum(self):
+        """آزادسازی تدریجی صفحات خالی (فقط با auto_vacuum = INCREMENTAL)"""
+        with self.db.pool.write() as conn:
+            incremental = conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+            if incremental:
+                conn.execute(f'PRAGMA incremental_vacuum({self.vacuum_pages})')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            pages = conn.execute('PRAGMA page_count').fetchone()[0]
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            size = conn.execute('PRAGMA page_size').fetchone()[0]
+        DB_BYTES.set((pages - free) * size)
+        if not incremental and not self.vacuum_hinted:
+            self.vacuum_hinted = True
+            print(f"🧹 {self.db.db_path} is not in incremental auto-vacuum mode ({free} free pages); "
+                  f"stop all processes and run: python retention.py --convert-vacuum")
+        return free
+
+    def convert_auto_vacuum(self):
+        """یکبار: تغییر به INCREMENTAL با VACUUM کامل
+
+        کل دیتابیس قفل میشود؛ فقط وقتی هیچ پردازه دیگری (وب، اسکنر، اعتبارسنج) در حال اجرا نیست
+        """
+        with self.db.pool.write() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return False
+            print(f"🧹 Switching {self.db.db_path} to incremental auto-vacuum (one-time VACUUM)")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        return True
+
+    def run_once(self):
+        started = time.time()
+        with RUN_SECONDS.time():
+            rolled = self.rollup_validations()
+            archived = {table: self.archive_table(table) for table in ARCHIVE_TABLES}
+            free = self.vacuum()
+        self.last_run = time.time()
+        if rolled or any(archived.values()):
+            print(f"🗄️ Retention: {rolled} validations rolled up, "
+                  f"{archived['signals']} signals / {archived['pump_dump_alerts']} alerts archived "
+                  f"in {self.last_run - started:.1f}s ({free} free pages left)")
+        return {'rolled_up': rolled, 'archived': archived, 'free_pages': free}
+
+    def run_loop(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+
+# نمونه گلوبال
+retention = RetentionManager(signal_db)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Database retention and maintenance')
+    parser.add_argument('--convert-vacuum', action='store_true',
+                        help='one-time switch to incremental auto-vacuum (run with all other processes stopped)')
+    args = parser.parse_args()
+
+    if args.convert_vacuum:
+        if not retention.convert_auto_vacuum():
+            print("🧹 Already in incremental auto-vacuum mode")
+    else:
+        print(retention.run_once())
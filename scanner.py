@@ -0,0 +1,529 @@
+"""
+اسکنر ارزها با زمانبندی هماهنگ با بسته شدن کندل
+اسکن کامل چند ثانیه بعد از بسته شدن هر کندل، بروزرسانی سبک در فاصله کندلها
+"""
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from database import signal_db
+from data_fetcher import exchange_manager
+from analysis_pool import analysis_executor
+from leaderboard import leaderboard
+from prescreen import prescreen
+from order_blocks import zone_index
+from pivots import pivot_index
+from pipeline import Pipeline, Stage
+from metrics import registry
+from snapshot import SnapshotStore, RawJSON, dumps
+
+CYCLE_SECONDS = registry.histogram('scanner_cycle_seconds', 'Full scan cycle duration')
+CARRIED_OVER = registry.gauge('scanner_carried_over_symbols', 'Symbols carried over to the next cycle')
+SYMBOLS_SCANNED = registry.counter('scanner_symbols_total', 'Symbols analyzed', ['result'])
+SIGNALS_FOUND = registry.counter('scanner_signals_total', 'Signals produced', ['new'])
+
+
+def bar_close_trigger(timeframe, settle_seconds):
+    """تریگر cron برای لحظه بسته شدن کندل هر تایمفریم"""
+    amount, unit = int(timeframe[:-1]), timeframe[-1]
+    if unit == 'm':
+        return CronTrigger(minute=f'*/{amount}', second=settle_seconds, timezone='UTC')
+    if unit == 'h':
+        return CronTrigger(hour=f'*/{amount}', minute=0, second=settle_seconds, timezone='UTC')
+    if unit == 'd':
+        return CronTrigger(day=f'*/{amount}', hour=0, minute=0, second=settle_seconds, timezone='UTC')
+    raise ValueError(f'Unsupported timeframe: {timeframe}')
+
+
+class MarketScanner:
+    """اسکن ارزها و انتشار نتایج"""
+
+    def __init__(self, timeframe='15m', universe_size=100, settle_seconds=5,
+                 refresh_seconds=60, candidate_seconds=5, fetch_workers=1, fetch_delay=0.3,
+                 cycle_budget=240, publish_interval=5):
+        self.timeframe = timeframe
+        self.universe_size = universe_size
+        self.settle_seconds = settle_seconds
+        self.refresh_seconds = refresh_seconds
+        self.candidate_seconds = candidate_seconds
+        self.fetch_workers = fetch_workers
+        self.fetch_delay = fetch_delay
+        self.cycle_budget = cycle_budget      # مهلت هر چرخه (ثانیه)؛ None یعنی بدون مهلت
+        self.publish_interval = publish_interval
+        self.stale_seconds = 3600
+        self.carry_over = []
+        self.shard = None
+        self.latest = OrderedDict()
+        self.latest_lock = threading.Lock()
+        self.published_at = 0
+        self.snapshots = SnapshotStore(
+            signals=[],
+            pump_dump=[],
+            movers={'gainers': [], 'losers': []},
+            last_update=None
+        )
+        self.emit = lambda event, data=None: None
+        self.scheduler = None
+        self.scan_lock = threading.Lock()
+        # سیگنالهای ذخیره شده (symbol, type, کندل) تا در اسکنهای بعدی تکرار نشوند
+        self.seen = OrderedDict()
+        self.seen_limit = 20000
+        self.seen_lock = threading.Lock()
+        self.board_dirty = False
+        self.board_emitted = 0
+        self.board_interval = 2
+        self.board_limit = 20                 # None = کل جدول (برای ترکیب در پردازه وب)
+        self.report_status = False            # ارسال وضعیت پیشغربالگری و پایپلاین به پردازه وب
+        self.flagged_sent = None
+        self.pipeline = self.build_pipeline()
+        registry.gauge(
+            'pipeline_queue_depth', 'Items waiting in each stage queue', ['stage'],
+            func=lambda: {(m['stage'],): m['queue_depth'] for m in self.pipeline.metrics()}
+        )
+
+    @property
+    def cache(self):
+        """آخرین نسخه تغییرناپذیر کش"""
+        return self.snapshots.current
+
+    def set_emitter(self, emit):
+        """تابع ارسال به کلاینتها (socketio.emit)"""
+        self.emit = emit
+
+    def _is_new(self, sig, df):
+        """آیا این سیگنال برای این کندل قبلا ثبت شده؟"""
+        i = sig.get('index')
+        bar = df['timestamp'].iloc[i] if isinstance(i, int) and -len(df) <= i < len(df) else df['timestamp'].iloc[-1]
+        key = (sig.get('symbol'), sig.get('type', sig.get('alert_type')), bar)
+
+        with self.seen_lock:
+            if key in self.seen:
+                return False
+            self.seen[key] = True
+            while len(self.seen) > self.seen_limit:
+                self.seen.popitem(last=False)
+            return True
+
+    # ---------- مراحل پایپلاین ----------
+
+    def fetch_stage(self, job):
+        """دریافت کندلها"""
+        cycle = job['cycle']
+        if cycle['deadline'] and time.time() > cycle['deadline']:
+            # به ابتدای چرخه بعد منتقل میشود
+            cycle['missed'].append(job['symbol'])
+            return None
+        cycle['jobs'].append(job)
+
+        df = exchange_manager.fetch_ohlcv(job['symbol'], self.timeframe, 200, context=job['context'])
+        time.sleep(self.fetch_delay)
+        if df.empty:
+            SYMBOLS_SCANNED.inc(result='no_data')
+            return None
+        job['df'] = df
+        job['bars'] = len(df)
+        return [job]
+
+    def analyze_stage(self, job):
+        """تحلیل در استخر پردازهها + ناحیهها + جدول امتیاز + حذف تکراری"""
+        symbol, df = job['symbol'], job['df']
+        signals = analysis_executor.analyze(df, symbol)
+
+        # بازگشت قیمت به ناحیههای Order Block
+        signals.extend(zone_index.process(symbol, df, signals))
+
+        # جدول امتیاز از همه سیگنالهای ارز
+        job['board_changed'] = leaderboard.update(symbol, signals, df['close'].iloc[-1])
+
+        signals.sort(key=lambda x: x.get('strength', 0), reverse=True)
+        signals = signals[:3]
+
+        job['new_signals'] = []
+        for sig in signals:
+            sig['detected_at'] = datetime.utcnow().isoformat()
+            sig['is_pump_dump'] = 'PUMP' in sig.get('type', '') or 'DUMP' in sig.get('type', '')
+            if self._is_new(sig, df):
+                job['new_signals'].append(sig)
+
+        self.record(symbol, signals)
+        job['cycle']['signals'] += len(signals)
+        SYMBOLS_SCANNED.inc(result='analyzed')
+        SIGNALS_FOUND.inc(len(job['new_signals']), new='true')
+        SIGNALS_FOUND.inc(len(signals) - len(job['new_signals']), new='false')
+        job['df'] = None
+        return [job]
+
+    def persist_stage(self, job):
+        """ذخیره در دیتابیس (صف نوشتن دستهای)"""
+        rows = 0
+        for sig in job['new_signals']:
+            signal_db.enqueue_signal(sig)
+            rows += 1
+            if sig['is_pump_dump']:
+                signal_db.enqueue_pump_dump(sig)
+                rows += 1
+        job['rows'] = rows
+        return [job]
+
+    def broadcast_stage(self, job):
+        """ارسال به کلاینتها"""
+        if job['new_signals']:
+            self.emit('new_signals', RawJSON(dumps(job['new_signals'])))
+
+        # جدول امتیاز حداکثر هر چند ثانیه یکبار
+        if job.get('board_changed'):
+            self.board_dirty = True
+        now = time.time()
+        if self.board_dirty and now - self.board_emitted >= self.board_interval:
+            self.board_dirty = False
+            self.board_emitted = now
+            self.emit('leaderboard_update', leaderboard.snapshot(self.board_limit))
+
+        # انتشار نتایج جزئی در کش
+        self.publish()
+        return None
+
+    # ---------- کش ----------
+
+    def record(self, symbol, signals):
+        """آخرین نتیجه هر ارز (نتیجه قبلی ارز جایگزین میشود)"""
+        with self.latest_lock:
+            self.latest[symbol] = (time.time(), signals)
+            self.latest.move_to_end(symbol)
+
+    def publish(self, force=False, **changes):
+        """ساخت نسخه جدید کش از آخرین نتیجه ارزها"""
+        now = time.time()
+        if not force and now - self.published_at < self.publish_interval:
+            return
+        self.published_at = now
+
+        with self.latest_lock:
+            # ارزهایی که مدتی اسکن نشدهاند (مثلا بعد از تغییر صرافی)
+            while self.latest:
+                symbol, (updated, _) = next(iter(self.latest.items()))
+                if now - updated < self.stale_seconds:
+                    break
+                self.latest.popitem(last=False)
+            signals = [sig for _, sigs in self.latest.values() for sig in sigs]
+
+        snapshot = self.snapshots.publish(
+            signals=signals[-100:],
+            pump_dump=[sig for sig in signals if sig['is_pump_dump']][-50:],
+            last_update=datetime.utcnow().isoformat(),
+            **changes
+        )
+
+        # ارسال بروزرسانی (JSON آماده)
+        self.emit('cache_update', snapshot.json['cache'])
+
+    def build_pipeline(self):
+        """fetch → analyze → persist → broadcast"""
+        return Pipeline([
+            Stage('fetch', self.fetch_stage, workers=self.fetch_workers, maxsize=50),
+            Stage('analyze', self.analyze_stage, workers=analysis_executor.workers, maxsize=analysis_executor.workers * 2),
+            Stage('persist', self.persist_stage, workers=1, maxsize=500),
+            Stage('broadcast', self.broadcast_stage, workers=1, maxsize=500)
+        ])
+
+    def submit(self, symbols, cycle, priority=1):
+        """ورود ارزها به پایپلاین؛ خروجی ارزهایی که تا مهلت ارسال نشدند"""
+        # همه کارهای یک چرخه با همان صرافی که چرخه با آن شروع شد
+        context = exchange_manager.context
+        for n, symbol in enumerate(symbols):
+            if cycle['deadline'] and time.time() > cycle['deadline']:
+                return list(symbols[n:])
+
+            # ارزهای مشکوک پیشغربالگری جلوتر از نوبت عادی
+            for candidate in self.owned(prescreen.pop_candidates()):
+                self.pipeline.submit({'symbol': candidate, 'cycle': cycle, 'context': context}, 0)
+            self.pipeline.submit({'symbol': symbol, 'cycle': cycle, 'context': context}, priority)
+        return []
+
+    def reset_exchange_state(self):
+        """نتایج صرافی قبلی دیگر معتبر نیست"""
+        self.carry_over = []
+        with self.latest_lock:
+            self.latest.clear()
+        leaderboard.clear()
+        # مرجع پیشغربالگری، ناحیهها و پیوتها هم از صرافی قبلی هستند
+        prescreen.clear()
+        zone_index.reset()
+        pivot_index.clear()
+        self.board_dirty = True
+        self.publish(force=True)
+
+    def set_shard(self, coordinator):
+        """فقط ارزهای سهم این اسکنر"""
+        self.shard = coordinator
+
+    def owned(self, symbols):
+        return self.shard.filter(symbols) if self.shard is not None else symbols
+
+    def pipeline_metrics(self):
+        return self.pipeline.metrics()
+
+    def send_status(self):
+        """وضعیت این اسکنر برای REST پردازه وب (پیشغربالگری فقط با هشدار جدید)"""
+        flagged = prescreen.get_flagged()
+        last = flagged[-1]['detected_at'] if flagged else None
+        if last != self.flagged_sent:
+            self.flagged_sent = last
+            self.emit('prescreen_update', flagged)
+        self.emit('pipeline_update', self.pipeline_metrics())
+
+    @staticmethod
+    def new_cycle(budget=None):
+        return {
+            'deadline': time.time() + budget if budget else None,
+            'missed': [],
+            'signals': 0,
+            'jobs': []
+        }
+
+    @staticmethod
+    def build_trace(cycle, started, ended):
+        """رکورد trace یک چرخه برای تحلیل بعدی"""
+        stages = {}
+        symbols = []
+        for job in cycle['jobs']:
+            timings = job.get('timings', {})
+            for stage, seconds in timings.items():
+                total = stages.setdefault(stage, {'total_ms': 0.0, 'max_ms': 0.0, 'max_symbol': None})
+                total['total_ms'] += seconds * 1000
+                if seconds * 1000 > total['max_ms']:
+                    total['max_ms'] = seconds * 1000
+                    total['max_symbol'] = job['symbol']
+            symbols.append({
+                'symbol': job['symbol'],
+                'ms': {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()},
+                'bars': job.get('bars', 0),
+                'signals': len(job.get('new_signals', [])),
+                'rows': job.get('rows', 0)
+            })
+        for total in stages.values():
+            total['total_ms'] = round(total['total_ms'], 1)
+            total['max_ms'] = round(total['max_ms'], 1)
+
+        return {
+            'kind': 'scan',
+            'started_at': datetime.utcfromtimestamp(started).isoformat(),
+            'ended_at': datetime.utcfromtimestamp(ended).isoformat(),
+            'duration_ms': round((ended - started) * 1000, 1),
+            'exchange': exchange_manager.exchange_id,
+            'items': len(symbols),
+            'bars_fetched': sum(s['bars'] for s in symbols),
+            'signals_produced': cycle['signals'],
+            'rows_written': sum(s['rows'] for s in symbols),
+            'errors': sum(1 for s in symbols if not s['bars']),
+            'detail': {'stages': stages, 'symbols': symbols, 'missed': cycle['missed']}
+        }
+
+    def run_full_scan(self):
+        """اسکن کامل؛ بعد از بسته شدن کندل"""
+        if not self.scan_lock.acquire(blocking=False):
+            print("⏭️ Previous scan still running, skipped")
+            return
+        try:
+            started = time.time()
+            # صرافی جدید (اگر آماده باشد) فقط در مرز چرخه جایگزین میشود
+            if exchange_manager.commit_pending():
+                self.reset_exchange_state()
+            cycle = self.new_cycle(self.cycle_budget)
+
+            # ارزهای جا مانده از چرخه قبل اول
+            carried = list(self.carry_over)
+            pending = set(carried)
+            universe = exchange_manager.symbols[:self.universe_size]
+            symbols = self.owned(carried + [s for s in universe if s not in pending])
+
+            unsent = self.submit(symbols, cycle)
+            self.pipeline.join()
+            self.finish_cycle(cycle, started, unsent)
+
+            self.publish(force=True, movers=exchange_manager.get_top_movers(20))
+
+            print(f"✅ Scan complete: {cycle['signals']} signals found in {time.time() - started:.1f}s"
+                  + (f" | {len(self.carry_over)} carried over" if self.carry_over else ""))
+        except Exception as e:
+            print(f"Scan error: {e}")
+        finally:
+            self.scan_lock.release()
+        self.schedule_catch_up()
+
+    def finish_cycle(self, cycle, started, unsent):
+        """ثبت ارزهای جا مانده، متریکها و trace چرخه"""
+        self.carry_over = cycle['missed'] + unsent
+        ended = time.time()
+        CYCLE_SECONDS.observe(ended - started)
+        CARRIED_OVER.set(len(self.carry_over))
+
+        try:
+            trace = self.build_trace(cycle, started, ended)
+            trace['detail']['missed'] = self.carry_over
+            signal_db.save_perf_trace(trace)
+        except Exception as e:
+            print(f"Trace error: {e}")
+
+    def schedule_catch_up(self):
+        """ارزهای جا مانده بلافاصله بعد از مهلت اسکن میشوند، نه در کندل بعد"""
+        if self.carry_over and self.scheduler is not None:
+            self.scheduler.add_job(self.run_catch_up, id='carry_over_catch_up', replace_existing=True)
+
+    def run_catch_up(self):
+        """اسکن ارزهای جا مانده تا قبل از بسته شدن کندل بعد"""
+        job = self.scheduler.get_job('bar_close_scan') if self.scheduler is not None else None
+        if job is None or job.next_run_time is None:
+            return
+        # اسکن کامل بعدی نباید به خاطر این چرخه رد شود
+        budget = job.next_run_time.timestamp() - time.time() - self.settle_seconds
+        if self.cycle_budget:
+            budget = min(budget, self.cycle_budget)
+        if budget < self.settle_seconds or not self.scan_lock.acquire(blocking=False):
+            return
+        try:
+            started = time.time()
+            carried = len(self.carry_over)
+            cycle = self.new_cycle(budget)
+            unsent = self.submit(self.owned(list(self.carry_over)), cycle)
+            self.pipeline.join()
+            self.finish_cycle(cycle, started, unsent)
+            self.publish(force=True)
+
+            print(f"✅ Catch-up complete: {carried - len(self.carry_over)}/{carried} carried symbols scanned "
+                  f"in {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"Catch-up error: {e}")
+        finally:
+            self.scan_lock.release()
+        self.schedule_catch_up()
+
+    def run_refresh(self):
+        """بروزرسانی سبک بین دو کندل: movers و ارزهای برتر جدول امتیاز"""
+        try:
+            board = leaderboard.snapshot(10)
+            symbols = self.owned([s['symbol'] for s in board['buy'] + board['sell']])
+            if symbols:
+                self.submit(symbols, self.new_cycle())
+
+            self.publish(force=True, movers=exchange_manager.get_top_movers(20))
+        except Exception as e:
+            print(f"Refresh error: {e}")
+
+    def run_candidates(self):
+        """تحلیل فوری ارزهای مشکوک پیشغربالگری"""
+        symbols = self.owned(prescreen.pop_candidates())
+        if symbols:
+            self.submit(symbols, self.new_cycle(), priority=0)
+        if self.report_status:
+            self.send_status()
+
+    def start(self):
+        """شروع زمانبندی"""
+        if self.scheduler is not None:
+            return
+
+        self.pipeline.start()
+        exchange_manager.deferred_commit = True
+        self.scheduler = BackgroundScheduler(timezone='UTC', job_defaults={
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': 30
+        })
+        self.scheduler.add_job(
+            self.run_full_scan, bar_close_trigger(self.timeframe, self.settle_seconds),
+            id='bar_close_scan'
+        )
+        self.scheduler.add_job(
+            self.run_refresh, 'interval', seconds=self.refresh_seconds, id='intra_bar_refresh'
+        )
+        self.scheduler.add_job(
+            self.run_candidates, 'interval', seconds=self.candidate_seconds, id='prescreen_candidates'
+        )
+        # اسکن اول بلافاصله
+        self.scheduler.add_job(self.run_full_scan, id='initial_scan')
+        self.scheduler.start()
+        print(f"🕒 Scanner scheduled at {self.timeframe} bar close (+{self.settle_seconds}s)")
+
+    def stop(self):
+        """توقف"""
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+        exchange_manager.deferred_commit = False
+        self.pipeline.stop()
+
+
+# نمونه گلوبال
+scanner = MarketScanner()
+
+
+def main():
+    """اجرای اسکنر بدون وب سرور (یک shard)"""
+    import argparse
+    from broadcast import broadcaster
+    from sharding import ShardCoordinator
+    from checkpoint import StateCheckpoint
+    from supervisor import follow_exchange
+
+    parser = argparse.ArgumentParser(description='Headless market scanner')
+    parser.add_argument('--shard', action='store_true', help='join the shard ring in signals.db')
+    parser.add_argument('--universe', type=int, default=250, help='number of symbols across all shards')
+    parser.add_argument('--broadcast', default='127.0.0.1:5001', help='web process broadcast address')
+    parser.add_argument('--state', help='warm-start checkpoint file (required with --shard, one per shard)')
+    args = parser.parse_args()
+    if args.state is None:
+        # shard ها نباید وضعیت یکدیگر را بازنویسی و بازیابی کنند
+        if args.shard:
+            parser.error('--state is required with --shard (one checkpoint file per shard)')
+        args.state = 'scanner_state.ckpt'
+
+    # متریکها برای /api/metrics پردازه وب (METRICS_PORT)
+    registry.serve()
+
+    # صرافی انتخاب شده در پردازه وب
+    follow_exchange()
+    exchange_manager.load_symbols(args.universe)
+    scanner.universe_size = args.universe
+
+    host, port = args.broadcast.rsplit(':', 1)
+    broadcaster.connect((host, int(port)))
+    scanner.set_emitter(broadcaster.emit)
+    # پردازه وب جدول، پیشغربالگری و پایپلاین همه shard ها را ترکیب میکند
+    scanner.board_limit = None
+    scanner.report_status = True
+
+    coordinator = None
+    if args.shard:
+        coordinator = ShardCoordinator(signal_db.db_path)
+        coordinator.start()
+        scanner.set_shard(coordinator)
+
+    # شروع گرم از آخرین checkpoint
+    checkpoint = StateCheckpoint(scanner, args.state)
+    checkpoint.restore()
+
+    prescreen.start()
+    analysis_executor.start()
+    scanner.start()
+    checkpoint.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scanner.stop()
+        checkpoint.stop()
+        if coordinator is not None:
+            coordinator.stop()
+        analysis_executor.stop()
+
+
+if __name__ == '__main__':
+    main()
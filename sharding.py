@@ -0,0 +1,136 @@
+"""
+تقسیم ارزها بین چند پردازه اسکنر با consistent hashing
+اجاره (lease) هر اسکنر در SQLite ثبت میشود؛ با ورود یا خروج اسکنر، ارزها دوباره تقسیم میشوند
+"""
+from bisect import bisect_left
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def _hash(key):
+    """هش پایدار بین پردازهها"""
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """حلقه consistent hashing با گرههای مجازی"""
+
+    def __init__(self, workers, vnodes=64):
+        self.workers = sorted(workers)
+        self.points = sorted(
+            (_hash(f'{worker}#{v}'), worker)
+            for worker in self.workers
+            for v in range(vnodes)
+        )
+        self.keys = [p for p, _ in self.points]
+
+    def owner(self, symbol):
+        if not self.points:
+            return None
+        pos = bisect_left(self.keys, _hash(symbol)) % len(self.points)
+        return self.points[pos][1]
+
+
+class ShardCoordinator:
+    """هماهنگی اسکنرها از طریق جدول lease در SQLite"""
+
+    def __init__(self, db_path='signals.db', worker_id=None, lease_seconds=30, vnodes=64):
+        self.db_path = db_path
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.lease_seconds = lease_seconds
+        self.vnodes = vnodes
+        self.ring = HashRing([self.worker_id], vnodes)
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.init_db()
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scanner_leases (
+                worker_id TEXT PRIMARY KEY,
+                host TEXT,
+                pid INTEGER,
+                started_at REAL,
+                heartbeat_at REAL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def heartbeat(self):
+        """تمدید lease و بروزرسانی حلقه"""
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO scanner_leases (worker_id, host, pid, started_at, heartbeat_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at
+            ''', (self.worker_id, socket.gethostname(), os.getpid(), now, now))
+            # حذف اسکنرهای مرده
+            conn.execute('DELETE FROM scanner_leases WHERE heartbeat_at < ?', (now - self.lease_seconds,))
+            conn.commit()
+            workers = [row['worker_id'] for row in conn.execute('SELECT worker_id FROM scanner_leases')]
+        finally:
+            conn.close()
+
+        with self.lock:
+            if sorted(workers) != self.ring.workers:
+                self.ring = HashRing(workers, self.vnodes)
+                print(f"🔀 Shards rebalanced: {len(workers)} scanner(s) alive")
+        return workers
+
+    def release(self):
+        """آزاد کردن lease هنگام خروج"""
+        conn = self.get_connection()
+        try:
+            conn.execute('DELETE FROM scanner_leases WHERE worker_id = ?', (self.worker_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def owns(self, symbol):
+        """آیا این ارز سهم این اسکنر است؟"""
+        with self.lock:
+            return self.ring.owner(symbol) == self.worker_id
+
+    def filter(self, symbols):
+        with self.lock:
+            ring = self.ring
+        return [s for s in symbols if ring.owner(s) == self.worker_id]
+
+    def status(self):
+        with self.lock:
+            return {'worker_id': self.worker_id, 'workers': list(self.ring.workers)}
+
+    def run_loop(self):
+        while self.running:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Shard heartbeat error: {e}")
+            time.sleep(self.lease_seconds / 3)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.heartbeat()
+            self.thread = threading.Thread(target=self.run_loop, daemon=True)
+            self.thread.start()
+            print(f"🧩 Shard worker {self.worker_id} started")
+
+    def stop(self):
+        self.running = False
+        self.release()
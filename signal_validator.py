@@ -7,6 +7,11 @@ from data_fetcher import exchange_manager
 import threading
 import time
 
+from metrics import registry
+
+ROUND_SECONDS = registry.histogram('validator_round_seconds', 'Duration of one validation round')
+CHECKS = registry.counter('validator_checks_total', 'Signal validations by resulting status', ['status'])
+
 class SignalValidator:
     """اعتبارسنجی سیگنالها"""
     
@@ -14,6 +19,11 @@ class SignalValidator:
         self.check_interval = check_interval
         self.running = False
         self.thread = None
+        self.last_round_at = None
+        registry.gauge(
+            'validator_lag_seconds', 'Seconds since the last completed validation round',
+            func=lambda: {(): round(time.time() - self.last_round_at, 1)} if self.last_round_at else {}
+        )
     
     def validate_signal(self, signal):
         """اعتبارسنجی یک سیگنال"""
@@ -81,15 +91,26 @@ class SignalValidator:
             print(f"Error validating signal: {e}")
             return None
     
-    def validate_all_active(self):
-        """اعتبارسنجی همه سیگنالهای فعال"""
+    def validate_all_active(self, trace=None):
+        """اعتبارسنجی همه سیگنالهای فعال (trace: لیست زمان هر سیگنال)"""
         active_signals = signal_db.get_active_signals()
         results = []
         
         for signal in active_signals:
+            started = time.perf_counter()
             result = self.validate_signal(signal)
+            if trace is not None:
+                trace.append({
+                    'signal_id': signal['id'],
+                    'symbol': signal['symbol'],
+                    'ms': round((time.perf_counter() - started) * 1000, 1),
+                    'status': result['status'] if result else 'ERROR'
+                })
             if result:
                 results.append(result)
+                CHECKS.inc(status=result['status'])
+            else:
+                CHECKS.inc(status='ERROR')
             time.sleep(0.2)  # Rate limiting
         
         return results
@@ -99,11 +120,27 @@ class SignalValidator:
         while self.running:
             try:
                 print(f"\n🔍 Validating signals at {datetime.now()}")
-                results = self.validate_all_active()
+                started = time.time()
+                items = []
+                with ROUND_SECONDS.time():
+                    results = self.validate_all_active(items)
+                self.last_round_at = time.time()
                 
                 success = len([r for r in results if r['status'] == 'SUCCESS'])
                 failed = len([r for r in results if r['status'] in ['FAILED', 'STOPPED']])
                 
+                signal_db.save_perf_trace({
+                    'kind': 'validation',
+                    'started_at': datetime.utcfromtimestamp(started).isoformat(),
+                    'ended_at': datetime.utcfromtimestamp(self.last_round_at).isoformat(),
+                    'duration_ms': round((self.last_round_at - started) * 1000, 1),
+                    'exchange': exchange_manager.exchange_id,
+                    'items': len(items),
+                    'rows_written': len(results),
+                    'errors': len(items) - len(results),
+                    'detail': {'closed': success + failed, 'signals': items}
+                })
+                
                 print(f"✅ Validated {len(results)} signals | Success: {success} | Failed: {failed}")
                 
             except Exception as e:
@@ -124,3 +161,27 @@ class SignalValidator:
         self.running = False
 
 validator = SignalValidator()
+
+
+def main():
+    """اجرای اعتبارسنج در پردازه جدا با کلاینت صرافی خودش"""
+    from supervisor import follow_exchange
+    from retention import retention
+
+    registry.serve()
+    follow_exchange()
+    validator.start()
+    retention.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        validator.stop()
+        retention.stop()
+
+
+if __name__ == '__main__':
+    main()
+
@@ -5,9 +5,11 @@ Smart Money, Order Blocks, Liquidity Hunt, Divergence, Whale Detection
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from ta.trend import EMAIndicator
+import time
+from ta.trend import EMAIndicator, MACD
 from ta.momentum import RSIIndicator
 from ta.volatility import AverageTrueRange
+from pivots import pivot_index, SwingPivotIndex
 from indicators import TechnicalIndicators
 
 class AdvancedSignalEngine:
@@ -80,6 +82,8 @@ class AdvancedSignalEngine:
                             'index': i,
                             'type': 'BULLISH_ORDER_BLOCK',
                             'signal': 'BUY',
+                            'top': df['high'].iloc[i-1],
+                            'bottom': df['low'].iloc[i-1],
                             'strength': min(int(move * 20), 90),
                             'price': df['close'].iloc[i],
                             'reason': f'📦 Bullish Order Block ({move:.1f}% move)',
@@ -97,6 +101,8 @@ class AdvancedSignalEngine:
                             'index': i,
                             'type': 'BEARISH_ORDER_BLOCK',
                             'signal': 'SELL',
+                            'top': df['high'].iloc[i-1],
+                            'bottom': df['low'].iloc[i-1],
                             'strength': min(int(move * 20), 90),
                             'price': df['close'].iloc[i],
                             'reason': f'📦 Bearish Order Block ({move:.1f}% move)',
@@ -164,47 +170,35 @@ class AdvancedSignalEngine:
     
     @staticmethod
     def find_divergences(df):
-        """یافتن واگراییها"""
+        """یافتن واگراییها بین نقاط چرخش متوالی"""
         if len(df) < 30:
             return []
         
-        df = df.copy()
-        df['rsi'] = RSIIndicator(df['close'], window=14).rsi()
+        rsi = RSIIndicator(df['close'], window=14).rsi()
+        macd = MACD(df['close']).macd_diff()
+        pivots = pivot_index.update(df, rsi, macd)
         
         divergences = []
-        lookback = 5
         
-        for i in range(lookback * 2, len(df)):
-            try:
-                if (df['close'].iloc[i] < df['close'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] > df['rsi'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] < 40):
-                    
-                    divergences.append({
-                        'index': i,
-                        'type': 'BULLISH_DIVERGENCE',
-                        'signal': 'BUY',
-                        'strength': 85,
-                        'price': df['close'].iloc[i],
-                        'reason': f'📈 RSI Bullish Divergence (RSI: {df["rsi"].iloc[i]:.1f})',
-                        'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else datetime.utcnow()
-                    })
-                
-                if (df['close'].iloc[i] > df['close'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] < df['rsi'].iloc[i-lookback] and
-                    df['rsi'].iloc[i] > 60):
-                    
-                    divergences.append({
-                        'index': i,
-                        'type': 'BEARISH_DIVERGENCE',
-                        'signal': 'SELL',
-                        'strength': 85,
-                        'price': df['close'].iloc[i],
-                        'reason': f'📉 RSI Bearish Divergence (RSI: {df["rsi"].iloc[i]:.1f})',
-                        'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else datetime.utcnow()
-                    })
-            except:
-                continue
+        for kind, prev, last, macd_confirms in SwingPivotIndex.divergences(pivots):
+            i = last['index']
+            confirm = ' + MACD' if macd_confirms else ''
+            
+            if kind == 'BULLISH':
+                sig_type, direction, icon = 'BULLISH_DIVERGENCE', 'BUY', '📈'
+            else:
+                sig_type, direction, icon = 'BEARISH_DIVERGENCE', 'SELL', '📉'
+            
+            divergences.append({
+                'index': i,
+                'type': sig_type,
+                'signal': direction,
+                'strength': 90 if macd_confirms else 85,
+                'reason': f'{icon} RSI{confirm} {kind.title()} Divergence (RSI: {prev["rsi"]:.1f} → {last["rsi"]:.1f})',
+                'price': df['close'].iloc[i],
+                'pivot_price': last['price'],
+                'timestamp': df['timestamp'].iloc[i] if 'timestamp' in df.columns else datetime.utcnow()
+            })
         
         return divergences[-5:] if divergences else []
     
@@ -338,27 +332,37 @@ class UltimateSignalGenerator:
         self.pump_dump = PumpDumpDetector()
         self.indicators = TechnicalIndicators()
     
-    def analyze(self, df, symbol):
-        """تحلیل کامل"""
+    @staticmethod
+    def _timed(timings, name, func, *args):
+        """اجرای یک detector و ثبت زمان آن"""
+        started = time.perf_counter()
+        result = func(*args)
+        if timings is not None:
+            timings[name] = time.perf_counter() - started
+        return result
+    
+    def analyze(self, df, symbol, timings=None):
+        """تحلیل کامل (timings: dict برای زمان هر detector)"""
         all_signals = []
+        run = lambda name, func, *args: self._timed(timings, name, func, *args)
         
         try:
             # سیگنالهای پیشرفته
-            smart_money = self.engine.detect_smart_money(df)
-            order_blocks = self.engine.find_order_blocks(df)
-            liquidity = self.engine.detect_liquidity_hunt(df)
-            divergence = self.engine.find_divergences(df)
-            whale = self.engine.detect_whale_activity(df)
+            smart_money = run('smart_money', self.engine.detect_smart_money, df)
+            order_blocks = run('order_blocks', self.engine.find_order_blocks, df)
+            liquidity = run('liquidity_hunt', self.engine.detect_liquidity_hunt, df)
+            divergence = run('divergence', self.engine.find_divergences, df)
+            whale = run('whale', self.engine.detect_whale_activity, df)
             
             # UT Bot
-            _, ut_alerts = self.indicators.ut_bot_alert(df)
+            _, ut_alerts = run('ut_bot', self.indicators.ut_bot_alert, df)
             
             # MA/EMA Cross
-            ma_crosses = self.indicators.detect_ma_ema_cross(df)
+            ma_crosses = run('ma_ema_cross', self.indicators.detect_ma_ema_cross, df)
             
             # پامپ و دامپ
-            pump = self.pump_dump.detect_pump(df, symbol)
-            dump = self.pump_dump.detect_dump(df, symbol)
+            pump = run('pump', self.pump_dump.detect_pump, df, symbol)
+            dump = run('dump', self.pump_dump.detect_dump, df, symbol)
             
             for sig_list in [smart_money, order_blocks, liquidity, divergence, whale, ut_alerts, ma_crosses]:
                 for sig in sig_list:
@@ -0,0 +1,92 @@
+"""
+نسخه تغییرناپذیر کش با JSON از پیش ساخته شده
+اسکنر هر بار یک نسخه جدید میسازد و یکجا جایگزین میکند؛ API و socket فقط بایتهای آماده را میفرستند
+"""
+from datetime import date, datetime
+from types import MappingProxyType
+import json
+import secrets
+import threading
+
+# شماره نسخه با هر اجرا از صفر شروع میشود؛ بدون این ETag کلاینت بعد از ری‌استارت 304 کهنه میگیرد
+BOOT_ID = secrets.token_hex(4)
+
+
+def _default(o):
+    """تبدیل Timestamp و انواع numpy"""
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if hasattr(o, 'isoformat'):
+        return o.isoformat()
+    if hasattr(o, 'item'):
+        return o.item()
+    return str(o)
+
+
+def dumps(obj):
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+class RawJSON(str):
+    """JSON از پیش ساخته شده؛ encoder پیامهای socket آن را بدون تغییر قرار میدهد"""
+    __slots__ = ()
+
+
+class SocketJSON:
+    """ماژول json برای SocketIO که RawJSON را دوباره serialize نمیکند"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        if isinstance(obj, RawJSON):
+            return str(obj)
+        if isinstance(obj, (list, tuple)) and any(isinstance(x, RawJSON) for x in obj):
+            return '[' + ','.join(str(x) if isinstance(x, RawJSON) else dumps(x) for x in obj) + ']'
+        kwargs.setdefault('default', _default)
+        return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return json.loads(s, *args, **kwargs)
+
+
+class CacheSnapshot:
+    """یک نسخه از کش؛ بعد از ساخت تغییر نمیکند"""
+
+    # بخشهایی که API جدا سرو میکند
+    VIEWS = {
+        'signals': lambda d: d['signals'][-50:],
+        'pump_dump': lambda d: d['pump_dump'],
+        'movers': lambda d: d['movers']
+    }
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = MappingProxyType(dict(data))
+        self.json = {'cache': RawJSON(dumps(dict(data)))}
+        for name, view in self.VIEWS.items():
+            self.json[name] = RawJSON(dumps(view(data)))
+        self.bytes = {name: raw.encode() for name, raw in self.json.items()}
+        self.etag = f'"{BOOT_ID}-v{version}"'
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class SnapshotStore:
+    """نگهداری آخرین نسخه؛ خواندن بدون قفل"""
+
+    def __init__(self, **initial):
+        self.lock = threading.Lock()
+        self.current = CacheSnapshot(0, initial)
+
+    def publish(self, **changes):
+        """ساخت نسخه جدید با تغییرات و جایگزینی اتمی"""
+        with self.lock:
+            data = dict(self.current.data)
+            data.update(changes)
+            snapshot = CacheSnapshot(self.current.version + 1, data)
+            self.current = snapshot
+        return snapshot
@@ -0,0 +1,162 @@
+"""
+اجرای وب، اسکنر و اعتبارسنج در پردازههای جدا با راهاندازی دوباره خودکار
+هر پردازه کلاینت صرافی خودش را دارد؛ ارتباط از طریق signals.db و کانال broadcast
+"""
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from database import signal_db
+from data_fetcher import exchange_manager
+
+
+def follow_exchange(interval=10):
+    """دنبال کردن صرافی انتخاب شده در پردازه وب (جدول runtime_config)"""
+    def loop():
+        while True:
+            try:
+                wanted = signal_db.get_runtime_value('exchange')
+                if wanted and wanted not in (exchange_manager.exchange_id, exchange_manager.pending_id):
+                    exchange_manager.prepare_switch(wanted)
+            except Exception as e:
+                print(f"Exchange follow error: {e}")
+            time.sleep(interval)
+
+    # شروع روی همان صرافی فعلی سیستم
+    wanted = signal_db.get_runtime_value('exchange')
+    if wanted and wanted != exchange_manager.exchange_id:
+        exchange_manager.change_exchange(wanted, load=False)
+    threading.Thread(target=loop, daemon=True).start()
+
+
+class ProcessSupervisor:
+    """نگهداری پردازههای فرزند؛ پردازه خارج شده با تاخیر افزایشی دوباره اجرا میشود"""
+
+    def __init__(self, commands, min_uptime=30, max_backoff=60, envs=None):
+        self.commands = commands        # name -> argv
+        self.envs = envs or {}          # name -> متغیرهای محیطی اضافه
+        self.min_uptime = min_uptime
+        self.max_backoff = max_backoff
+        self.procs = {}
+        self.started_at = {}
+        self.backoff = {name: 1 for name in commands}
+        self.restart_at = {}
+        self.restarts = {name: 0 for name in commands}
+        self.running = False
+
+    def spawn(self, name):
+        self.procs[name] = subprocess.Popen(self.commands[name], env={**os.environ, **self.envs.get(name, {})})
+        self.started_at[name] = time.time()
+        print(f"▶️ {name} started (pid {self.procs[name].pid})")
+
+    def check(self):
+        """بررسی پردازهها و راهاندازی دوباره"""
+        now = time.time()
+        for name, proc in list(self.procs.items()):
+            if proc is None:
+                if now >= self.restart_at[name]:
+                    self.restarts[name] += 1
+                    self.spawn(name)
+                continue
+
+            code = proc.poll()
+            if code is None:
+                continue
+
+            # خروج زودهنگام پشت سر هم = تاخیر بیشتر
+            if now - self.started_at[name] < self.min_uptime:
+                self.backoff[name] = min(self.backoff[name] * 2, self.max_backoff)
+            else:
+                self.backoff[name] = 1
+            self.procs[name] = None
+            self.restart_at[name] = now + self.backoff[name]
+            print(f"⚠️ {name} exited with code {code}, restarting in {self.backoff[name]}s")
+
+    def status(self):
+        return {
+            name: {
+                'pid': proc.pid if proc is not None else None,
+                'alive': proc is not None and proc.poll() is None,
+                'restarts': self.restarts[name]
+            }
+            for name, proc in self.procs.items()
+        }
+
+    def run(self):
+        """اجرا تا دریافت SIGINT/SIGTERM"""
+        self.running = True
+        signal.signal(signal.SIGTERM, lambda *args: self.stop())
+        for name in self.commands:
+            self.spawn(name)
+        try:
+            while self.running:
+                self.check()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=15):
+        """توقف همه پردازهها (اسکنر checkpoint را ذخیره میکند)"""
+        self.running = False
+        procs = [p for p in self.procs.values() if p is not None and p.poll() is None]
+        for proc in procs:
+            proc.send_signal(signal.SIGINT)
+        deadline = time.time() + timeout
+        for proc in procs:
+            try:
+                proc.wait(max(deadline - time.time(), 0.1))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.procs = {}
+
+
+def build_commands(scanners=1, universe=250, broadcast='127.0.0.1:5001'):
+    """دستور اجرای هر پردازه"""
+    python = sys.executable
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        'web': [python, os.path.join(here, 'app.py'), '--mode', 'web', '--no-validator'],
+        'validator': [python, os.path.join(here, 'signal_validator.py')]
+    }
+    for i in range(scanners):
+        argv = [python, os.path.join(here, 'scanner.py'), '--universe', str(universe), '--broadcast', broadcast]
+        if scanners > 1:
+            argv += ['--shard', '--state', f'scanner_state_{i}.ckpt']
+        commands[f'scanner-{i}'] = argv
+    return commands
+
+
+def build_metrics_envs(commands, base_port=9100):
+    """پورت متریک هر پردازه فرزند؛ پردازه وب همه را در /api/metrics ترکیب میکند"""
+    envs, targets = {}, []
+    children = [name for name in commands if name != 'web']
+    for port, name in enumerate(children, base_port):
+        envs[name] = {'METRICS_PORT': str(port), 'METRICS_PROCESS': name}
+        targets.append(f'127.0.0.1:{port}')
+    envs['web'] = {'METRICS_TARGETS': ','.join(targets)}
+    return envs
+
+
+def main(scanners=1, universe=250):
+    print(f"🧭 Supervising web, validator and {scanners} scanner process(es)")
+    # کلید کانال broadcast برای این اجرا (پردازههای فرزند از محیط میخوانند)
+    os.environ.setdefault('BROADCAST_AUTHKEY', secrets.token_hex(16))
+    commands = build_commands(scanners, universe)
+    envs = build_metrics_envs(commands, int(os.environ.get('METRICS_BASE_PORT', 9100)))
+    ProcessSupervisor(commands, envs=envs).run()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run web, scanner and validator as supervised processes')
+    parser.add_argument('--scanners', type=int, default=1)
+    parser.add_argument('--universe', type=int, default=250)
+    args = parser.parse_args()
+    main(args.scanners, args.universe)
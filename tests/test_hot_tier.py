@@ -0,0 +1,114 @@
+"""
+لایه داغ باید دقیقا همان نتیجه query_signals دیتابیس را بدهد (مرز داغ/سرد، NULL و cursor)
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def tiers(tmp_path, monkeypatch):
+    # نمونههای گلوبال ماژولها signals.db را در پوشه جاری میسازند
+    monkeypatch.chdir(tmp_path)
+    from database import SignalDatabase
+    from hot_tier import HotTier
+
+    db = SignalDatabase(str(tmp_path / 'test.db'))
+    now = datetime.utcnow().replace(microsecond=0)
+    rows = []
+    for i in range(120):
+        # هر دو ردیف در یک ثانیه؛ بازه 48 ساعت (نیمی داغ، نیمی سرد)
+        created = now - timedelta(minutes=24 * (i // 2))
+        rows.append((
+            ('BTC/USDT', 'ETH/USDT', 'SOL/USDT')[i % 3],
+            ('RSI_OVERSOLD', 'MACD_CROSS')[i % 2],
+            ('BUY', 'SELL')[i % 5 % 2],
+            100.0,
+            None if i % 7 == 0 else (i * 13) % 100,
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+            ('ACTIVE', 'SUCCESS', 'FAILED')[i % 4 % 3]
+        ))
+    with db.pool.write() as conn:
+        conn.executemany('''
+            INSERT INTO signals (symbol, signal_type, direction, entry_price, strength, created_at, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+
+    hot = HotTier(db, hours=24)
+    hot.load()
+    yield db, hot, now
+    db.close()
+
+
+FILTERS = [
+    {},
+    {'symbol': 'ETH/USDT'},
+    {'signal_type': 'MACD_CROSS', 'direction': 'BUY'},
+    {'status': 'SUCCESS'},
+    {'min_strength': 0},
+    {'min_strength': 50},
+    {'min_strength': 0, 'symbol': 'BTC/USDT'}
+]
+
+
+def _ids(page):
+    return [s['id'] for s in page['signals']]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_query_matches_database(tiers, filters):
+    db, hot, now = tiers
+    for since, until in [(None, None), (now - timedelta(hours=36), None),
+                         (now - timedelta(hours=30), now - timedelta(hours=12)), (now - timedelta(hours=6), None)]:
+        expected = db.query_signals(since=since, until=until, limit=500, **filters)
+        got = hot.query_signals(since=since, until=until, limit=500, **filters)
+        assert _ids(got) == _ids(expected)
+        assert got['signals'] == expected['signals']
+
+
+def test_null_strength_is_filtered_like_sql(tiers):
+    db, hot, _ = tiers
+    signals = hot.query_signals(min_strength=0, limit=500)['signals']
+    assert signals and all(s['strength'] is not None for s in signals)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('limit', [1, 7, 25])
+def test_cursor_paging_across_boundary(tiers, filters, limit):
+    db, hot, _ = tiers
+    pages = {'hot': [], 'db': []}
+    for name, source in (('hot', hot), ('db', db)):
+        cursor = None
+        while True:
+            page = source.query_signals(limit=limit, cursor=cursor, **filters)
+            pages[name].append(_ids(page))
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+    assert pages['hot'] == pages['db']
+    # همه صفحهها با هم = یک query بدون صفحهبندی
+    assert sum(pages['hot'], []) == _ids(db.query_signals(limit=500, **filters))
+
+
+def test_size_trimmed_hot_tier_matches_database(tiers):
+    db, _, _ = tiers
+    from hot_tier import HotTier
+
+    # مرز داغ/سرد با حداکثر تعداد ردیف (نه بازه زمانی)
+    hot = HotTier(db, hours=24, max_signals=15)
+    hot.load()
+    assert len(hot.tables['signals'].rows) <= 15
+    for filters in FILTERS:
+        cursor, hot_ids = None, []
+        while True:
+            page = hot.query_signals(limit=4, cursor=cursor, **filters)
+            hot_ids += _ids(page)
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert hot_ids == _ids(db.query_signals(limit=500, **filters))
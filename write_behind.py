@@ -0,0 +1,165 @@
+"""
+صف نوشتن با تاخیر (write-behind) برای درج دستهای
+فراخواننده فقط رکورد را در صف میگذارد؛ یک thread هر N رکورد یا هر T میلیثانیه یکجا ذخیره میکند
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import registry
+
+FLUSH_SECONDS = registry.histogram('write_behind_flush_seconds', 'Duration of one batched flush', ['queue'])
+BATCH_ROWS = registry.histogram('write_behind_batch_rows', 'Rows per flushed batch', ['queue'],
+                                buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+ROWS = registry.counter('write_behind_rows_total', 'Rows by outcome', ['queue', 'result'])
+BLOCKED = registry.counter('write_behind_blocked_total', 'Enqueues that waited because the queue was full', ['queue'])
+QUEUE_DEPTH = registry.gauge('write_behind_queue_depth', 'Rows waiting to be flushed', ['queue'])
+RETRIES = registry.counter('write_behind_retries_total', 'Flush attempts retried after a transient error', ['queue'])
+
+_STOP = object()
+
+
+def _is_transient(e):
+    """قفل بودن دیتابیس توسط نویسنده پردازه دیگر (با تاخیر برطرف میشود)"""
+    e = getattr(e, 'orig', e)   # خطای SQLAlchemy
+    return isinstance(e, sqlite3.OperationalError) and ('locked' in str(e) or 'busy' in str(e))
+
+
+class WriteBehindQueue:
+    """صف محدود + thread ذخیره دستهای"""
+
+    def __init__(self, name, flush_fn, max_rows=200, flush_ms=250, maxsize=10000, retry_delays=(0.1, 0.5, 2)):
+        self.name = name
+        self.flush_fn = flush_fn        # list[record] -> None (یک تراکنش)
+        self.max_rows = max_rows
+        self.flush_ms = flush_ms
+        self.retry_delays = retry_delays
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.flushed = 0
+        self.failed = 0
+        QUEUE_DEPTH.set(0, queue=name)
+        atexit.register(self.stop)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f'write-behind-{self.name}', daemon=True)
+                self.thread.start()
+
+    def put(self, record):
+        """افزودن به صف؛ فقط اگر صف پر باشد منتظر میماند"""
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            BLOCKED.inc(queue=self.name)
+            self.queue.put(record)
+
+    def _collect(self):
+        """جمعآوری یک دسته تا max_rows یا پایان مهلت flush_ms"""
+        first = self.queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._flush(batch)
+            if stop:
+                # باقیمانده صف قبل از خروج
+                rest = []
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        rest.append(item)
+                    else:
+                        self.queue.task_done()
+                for n in range(0, len(rest), self.max_rows):
+                    self._flush(rest[n:n + self.max_rows])
+                self.queue.task_done()
+                break
+
+    def _write(self, records):
+        """یک تراکنش؛ خطای قفل دیتابیس با تاخیر افزایشی دوباره امتحان میشود"""
+        for delay in self.retry_delays + (None,):
+            try:
+                return self.flush_fn(records)
+            except Exception as e:
+                if delay is None or not _is_transient(e):
+                    raise
+                RETRIES.inc(queue=self.name)
+                time.sleep(delay)
+
+    def _flush(self, batch):
+        written = 0
+        try:
+            with FLUSH_SECONDS.time(queue=self.name):
+                self._write(batch)
+            written = len(batch)
+        except Exception as e:
+            print(f"❌ Write-behind {self.name} flush error ({len(batch)} rows): {e}")
+            if len(batch) > 1 and not _is_transient(e):
+                # ردیف به ردیف؛ فقط ردیف خراب از دست میرود
+                for record in batch:
+                    try:
+                        self._write([record])
+                        written += 1
+                    except Exception as e:
+                        print(f"❌ Write-behind {self.name} dropped row: {e}")
+        finally:
+            failed = len(batch) - written
+            self.flushed += written
+            self.failed += failed
+            if written:
+                ROWS.inc(written, queue=self.name, result='written')
+            if failed:
+                ROWS.inc(failed, queue=self.name, result='failed')
+            BATCH_ROWS.observe(len(batch), queue=self.name)
+            QUEUE_DEPTH.set(self.queue.qsize(), queue=self.name)
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """انتظار تا ذخیره همه رکوردهای صف"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def stop(self):
+        """ذخیره باقیمانده و توقف"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        return {
+            'queue': self.name,
+            'depth': self.queue.qsize(),
+            'max': self.queue.maxsize,
+            'flushed': self.flushed,
+            'failed': self.failed
+        }